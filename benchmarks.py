@@ -0,0 +1,557 @@
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import datetime
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import holidays
+import numpy as np
+import pandas as pd
+
+from utils import adjust_descriptive_count_description, adjust_descriptive_count_title, aggregate_files_to_datasets, analyze_keywords, assign_size_bins, calendar_features, classify_mime_types, count_words, determine_affiliation, determine_affiliations, extract_max_version, extract_max_versions, filter_sensitive_datasets, flag_documentation_files, flag_sensitive_terms, iter_datacite, retrieve_all_institutions, retrieve_all_journals, retrieve_native_datasets, safe_split, score_metadata_quality, screen_sensitive_datasets
+
+# Benchmarks for the slow steps in utils.py and the notebooks
+## Run with `python benchmarks.py` (`--size small|medium|large` for 1k/100k/1M rows, `--only` to pick benchmarks)
+## Where an older implementation exists, the benchmark checks its output against it; retrieval benchmarks run against a local fake API server
+
+### Synthetic data ###
+
+words = ['data', 'survey', 'study', 'river', 'sample', 'analysis', 'texas', 'model', 'results', 'transect', 'soil', 'measurements', 'code', 'replication', 'students', 'climate']
+sensitive_terms = ['patient', 'health', 'mental health', 'child', 'children', 'minor', 'HIPAA', 'confidential', 'identifiable', 'race', 'ethnicity', 'income', 'interview', 'medical', 'clinical', 'IRB']
+
+# Builds a frame of titles, descriptions, and keywords where roughly 1 in 20 rows mentions a sensitive term
+def make_metadata_frame(rows, seed=0):
+    rng = random.Random(seed)
+
+    def text(length):
+        tokens = [rng.choice(words) for _ in range(length)]
+        if rng.random() < 0.05:
+            tokens.insert(rng.randrange(length), rng.choice(sensitive_terms) + rng.choice(['', 's', 'ly']))
+        return ' '.join(tokens)
+
+    return pd.DataFrame({
+        'title': [text(8) for _ in range(rows)],
+        'description': [text(60) if rng.random() > 0.02 else '' for _ in range(rows)],
+        'keywords': ['; '.join(text(2) for _ in range(3)) for _ in range(rows)],
+    })
+
+mime_types = ['text/csv', 'application/pdf', 'image/png', 'audio/mpeg', 'video/mp4', 'application/zip', 'text/plain']
+subject_lists = [['Earth and Environmental Sciences'], ['Social Sciences', 'Medicine, Health and Life Sciences'], ['Engineering'], [], ['Computer and Information Science', 'Other']]
+licenses = ['CC0 1.0', 'CC0 1.0', 'CC0 1.0', 'CC BY 4.0', 'Custom Dataset Terms']
+
+# Builds a file-level frame with the columns used by the sensitive-data criteria
+def make_file_frame(rows, seed=0):
+    rng = random.Random(seed)
+    return pd.DataFrame({
+        'metadata_flags': [rng.choice(sensitive_terms) if rng.random() < 0.05 else '' for _ in range(rows)],
+        'restricted': [rng.random() < 0.03 for _ in range(rows)],
+        'original_mime_type': [rng.choice(mime_types) for _ in range(rows)],
+        'license': [rng.choice(licenses) for _ in range(rows)],
+    })
+
+nondescriptive_words = frozenset(['data', 'dataset', 'study', 'results', 'code', 'the', 'of', 'and', 'for'])
+
+# Builds a dataset-level frame with reformatted titles, descriptions, and keyword lists
+def make_completeness_frame(rows, seed=0):
+    df = make_metadata_frame(rows, seed)
+    df['title_reformatted'] = [title + ' supplemental material' if index % 25 == 0 else title for index, title in enumerate(df['title'])]
+    df['keywords'] = df['keywords'].str.split('; ')
+    return df
+
+# Builds file sizes spread over every size bin, with empty files and missing sizes
+def make_file_size_frame(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    sizes = np.exp(rng.uniform(0, math.log(80 * 1024 ** 3), rows)).round()
+    sizes[rng.random(rows) < 0.02] = 0
+    sizes[rng.random(rows) < 0.01] = np.nan
+    return pd.DataFrame({'file_size': sizes})
+
+# Builds Search API-style version values: floats, 'major.minor' strings, and semicolon-joined lists from merged rows
+def make_version_series(rows, seed=0):
+    rng = random.Random(seed)
+    values = []
+    for _ in range(rows):
+        draw = rng.random()
+        if draw < 0.5:
+            values.append(float(rng.randint(1, 5)) + rng.randint(0, 3) / 10)
+        elif draw < 0.9:
+            values.append(f'{rng.randint(1, 5)}.{rng.randint(0, 3)}')
+        else:
+            values.append('; '.join(f'{rng.randint(1, 5)}.{rng.randint(0, 3)}' for _ in range(rng.randint(2, 4))))
+    return pd.Series(values, dtype=object)
+
+# Builds ISO event dates over ten years, with some unparseable and missing values
+def make_date_series(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp('2015-01-01') + pd.to_timedelta(rng.integers(0, 3650, rows), unit='D')
+    values = pd.Series(dates.strftime('%Y-%m-%d'), dtype=object)
+    values[rng.random(rows) < 0.01] = 'not a date'
+    values[rng.random(rows) < 0.01] = None
+    return values
+
+# Builds first/last author pairs with affiliations, some of them at UT Austin
+def make_author_pair_frame(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    affiliations = np.array(['The University of Texas at Austin', 'UT Austin, Department of Geosciences', 'Texas A&M University', 'Rice University', 'University of Houston', 'Dell Medical School', ''], dtype=object)
+    return pd.DataFrame({
+        'first_author': rng.integers(0, 50, rows).astype(str),
+        'last_author': rng.integers(0, 50, rows).astype(str),
+        'first_affiliation': affiliations[rng.integers(0, len(affiliations), rows)],
+        'last_affiliation': affiliations[rng.integers(0, len(affiliations), rows)]
+    })
+
+# Builds semicolon-delimited subject/keyword strings, lists, and blanks
+def make_delimited_series(rows, seed=0):
+    rng = random.Random(seed)
+    values = []
+    for _ in range(rows):
+        draw = rng.random()
+        if draw < 0.05:
+            values.append(np.nan)
+        elif draw < 0.15:
+            values.append([rng.choice(words) for _ in range(3)])
+        else:
+            values.append('; '.join(rng.choice(words) for _ in range(rng.randint(1, 5))))
+    return pd.Series(values, dtype=object)
+
+# Builds a file-level frame shaped like df_file_entries_combined_deduplicated (about 8 files per dataset)
+def make_file_entries_frame(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    dataset_ids = np.sort(rng.integers(0, max(rows // 8, 1), rows))
+    formats = np.array(['CSV', 'PDF', 'PNG', 'MP3', 'MP4', 'ZIP', 'Plain text'])
+    return pd.DataFrame({
+        'dataset_id': dataset_ids,
+        'doi': [f'10.18738/T8/{dataset_id:06d}' for dataset_id in dataset_ids],
+        'institution': np.array(['UT Austin', 'Texas A&M', 'Texas Tech', 'UNT'])[dataset_ids % 4],
+        'file_name': [f'file_{index}.csv' for index in range(rows)],
+        'file_id': np.arange(rows),
+        'file_mime_type': np.array(mime_types)[rng.integers(0, len(mime_types), rows)],
+        'friendly_format_manual': formats[rng.integers(0, len(formats), rows)],
+        'file_size': rng.integers(0, 10 * 1024 ** 3, rows),
+        'file_restricted': rng.random(rows) < 0.03,
+        'file_readme': rng.random(rows) < 0.1,
+        'file_codebook': rng.random(rows) < 0.05,
+        'file_data_dict': rng.random(rows) < 0.05,
+        'file_software': rng.random(rows) < 0.1,
+        'file_compressed': rng.random(rows) < 0.1,
+        'file_microsoft_office': rng.random(rows) < 0.2,
+        'file_documentation': rng.random(rows) < 0.15,
+        'dataset_subjects': [subject_lists[dataset_id % len(subject_lists)] for dataset_id in dataset_ids],
+    })
+
+# Builds one Dataverse Search API page of dataset items
+def make_search_page(institution, start, per_page, total):
+    items = [
+        {
+            'global_id': f'doi:10.18738/T8/{institution.upper()}{index:06d}',
+            'type': 'dataset',
+            'name': f'Dataset {index} from {institution}',
+            'versionState': 'RELEASED',
+            'majorVersion': 1,
+            'minorVersion': index % 3,
+            'versionId': index,
+            'createdAt': '2024-01-01T00:00:00Z',
+            'updatedAt': '2024-06-01T00:00:00Z',
+            'identifier_of_dataverse': institution,
+            'name_of_dataverse': institution,
+            'subjects': ['Earth and Environmental Sciences'],
+        }
+        for index in range(start, min(start + per_page, total))
+    ]
+    return {'status': 'OK', 'data': {'total_count': total, 'start': start, 'items': items}}
+
+# Builds one Native API dataset response with a handful of files
+def make_native_dataset(doi):
+    return {'status': 'OK', 'data': {'id': abs(hash(doi)) % 10 ** 6, 'latestVersion': {
+        'datasetPersistentId': f'doi:{doi}',
+        'versionState': 'RELEASED',
+        'metadataBlocks': {'citation': {'fields': [{'typeName': 'title', 'value': f'Dataset {doi}'}]}},
+        'files': [{'restricted': False, 'dataFile': {'id': index, 'filename': f'file_{index}.csv', 'contentType': 'text/csv', 'filesize': 1024 * index, 'storageIdentifier': f's3://{doi}/{index}'}} for index in range(5)],
+    }}}
+
+# Builds one DataCite /dois page with a 'next' link, like the DataCite API's cursor pagination
+def make_datacite_page(base_url, page, per_page, total):
+    start = (page - 1) * per_page
+    data = [{'id': f'10.18738/t8/{index:06d}', 'attributes': {'doi': f'10.18738/t8/{index:06d}', 'viewCount': index % 50, 'downloadCount': index % 20, 'citationCount': index % 3}} for index in range(start, min(start + per_page, total))]
+    links = {'next': f"{base_url}/dois?{urlencode({'page[number]': page + 1, 'page[size]': per_page, 'total': total})}"} if start + per_page < total else {}
+    return {'data': data, 'meta': {'total': total}, 'links': links}
+
+# Builds one page of a Crossref journal works listing; the cursor is the page number ('*' for the first page)
+## Records carry the bulky fields of real work records (abstract, references); select keeps only the listed fields
+def make_crossref_page(issn, cursor, rows, total, select=None):
+    page = 0 if cursor == '*' else int(cursor)
+    start = page * rows
+    items = [
+        {
+            'DOI': f'10.1000/{issn}.{index:06d}',
+            'title': [f'Article {index} in {issn}'],
+            'ISSN': [issn],
+            'published': {'date-parts': [[2020 + index % 5, 1 + index % 12]]},
+            'author': [{'given': 'Author', 'family': f'Number {number}', 'affiliation': [{'name': 'University of Texas at Austin'}]} for number in range(5)],
+            'abstract': ' '.join(words[(index + position) % len(words)] for position in range(250)),
+            'reference': [{'key': f'ref{number}', 'DOI': f'10.1000/ref.{number}', 'unstructured': 'Reference text ' * 10} for number in range(30)],
+        }
+        for index in range(start, min(start + rows, total))
+    ]
+    if select:
+        fields = select.split(',')
+        items = [{field: item[field] for field in fields if field in item} for item in items]
+    return {'message': {'items': items, 'total-results': total, 'next-cursor': str(page + 1) if start + rows < total else None}}
+
+### Fake API server ###
+
+# Serves the Search, Native, DataCite, and Crossref endpoints above from memory, with a fixed latency per request
+## Search totals per institution are passed in the 'q' parameter (e.g. q=5000) so one server covers every benchmark size
+class FakeAPIHandler(BaseHTTPRequestHandler):
+    latency = 0.02
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        base_url = f'http://{self.server.server_address[0]}:{self.server.server_address[1]}'
+        if url.path == '/api/search':
+            body = make_search_page(query.get('subtree', 'tdr'), int(query.get('start', 0)), int(query.get('per_page', 10)), int(query.get('q', 0)))
+        elif url.path == '/api/datasets/:persistentId/':
+            body = make_native_dataset(query['persistentId'].replace('doi:', ''))
+        elif url.path == '/dois':
+            body = make_datacite_page(base_url, int(query.get('page[number]', 1)), int(query.get('page[size]', 100)), int(query.get('total', 0)))
+        elif url.path.startswith('/journals/'):
+            body = make_crossref_page(url.path.split('/')[2], query.get('cursor', '*'), int(query.get('rows', 20)), int(query.get('total', 0)), query.get('select'))
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+# Listen backlog large enough for every worker to connect at once (the default of 5 makes extra connections wait for a retry)
+class FakeAPIServer(ThreadingHTTPServer):
+    request_queue_size = 128
+    daemon_threads = True
+
+# Starts the fake server on a free local port and returns it with its base URL (call server.shutdown() when done)
+def start_fake_server(latency=0.02):
+    handler = type('Handler', (FakeAPIHandler,), {'latency': latency})
+    server = FakeAPIServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+### Reference implementations ###
+
+# Original per-row, per-column, per-term implementation of flag_sensitive_terms
+def flag_sensitive_terms_rowwise(df, terms, columns):
+    patterns = [re.compile(rf'\b{re.escape(term)}\w*\b', re.IGNORECASE) for term in terms]
+    flags_list = []
+    sources_list = []
+    for idx, row in df.iterrows():
+        matched_terms = []
+        matched_sources = []
+        for col in columns:
+            text = row[col]
+            if pd.isnull(text) or text == '':
+                continue
+            col_matches = []
+            for pattern in patterns:
+                matches = pattern.findall(text)
+                if matches:
+                    col_matches.extend(matches)
+            if col_matches:
+                matched_terms.extend(col_matches)
+                matched_sources.append(col)
+        flags_list.append('; '.join(sorted(set(matched_terms), key=matched_terms.index)))
+        sources_list.append('; '.join(sorted(set(matched_sources), key=matched_sources.index)))
+    df['metadata_flags'] = flags_list
+    df['metadata_source'] = sources_list
+    return df
+
+# Original per-row implementation of add_final_source_column
+def add_final_source_column_rowwise(df):
+    final_sources = []
+    for idx, row in df.iterrows():
+        sources = []
+        if row.get('metadata_flags', '').strip() != '':
+            sources.append('metadata')
+        restricted_val = row.get('restricted', '')
+        if restricted_val is True or ('True' in str(restricted_val)):
+            sources.append('restricted')
+        mimetype_val = str(row.get('original_mime_type', ''))
+        if any(mt in mimetype_val.lower() for mt in ['audio/', 'video/']):
+            sources.append('file format')
+        license_val = row.get('license', '')
+        if license_val != 'CC0 1.0':
+            sources.append('license')
+        final_sources.append('; '.join(sources))
+    df['flags_source'] = final_sources
+    return df
+
+# Original per-row scoring with count_words, analyze_keywords, and adjust_descriptive_count_*
+def score_metadata_quality_rowwise(df):
+    scores = pd.DataFrame(index=df.index)
+    scores['total_word_count_title'], scores['descriptive_word_count_title'] = zip(*df['title_reformatted'].apply(count_words, args=(nondescriptive_words,)))
+    scores['total_word_count_description'], scores['descriptive_word_count_description'] = zip(*df['description'].apply(count_words, args=(nondescriptive_words,)))
+    combined = df.join(scores)
+    scores['descriptive_word_count_title'] = combined.apply(adjust_descriptive_count_title, axis=1)
+    scores['descriptive_word_count_description'] = combined.apply(adjust_descriptive_count_description, axis=1)
+    keyword_scores = pd.DataFrame(list(df['keywords'].apply(analyze_keywords, args=(nondescriptive_words,))), index=df.index)
+    return scores.join(keyword_scores)
+
+# Original loop over bins in assign_size_bins (one boolean mask per bin, labels stored as text)
+def assign_size_bins_loop(df, column='file_size', new_column='file_size_bin'):
+    df = df.copy()
+    bins = [
+        (1, 1 * 1024, '0-10 kB'),
+        (1 * 1024, 1 * 1024 * 1024, '10 kB-1 MB'),
+        (1 * 1024 * 1024, 100 * 1024 * 1024, '1-100 MB'),
+        (100 * 1024 * 1024, 1 * 1024 * 1024 * 1024, '100 MB-1 GB'),
+        (1 * 1024 * 1024 * 1024, 10 * 1024 * 1024 * 1024, '1-10 GB'),
+        (10 * 1024 * 1024 * 1024, 15 * 1024 * 1024 * 1024, '10-15 GB'),
+        (15 * 1024 * 1024 * 1024, 20 * 1024 * 1024 * 1024, '15-20 GB'),
+        (20 * 1024 * 1024 * 1024, 25 * 1024 * 1024 * 1024, '20-25 GB'),
+        (25 * 1024 * 1024 * 1024, 30 * 1024 * 1024 * 1024, '25-30 GB'),
+        (30 * 1024 * 1024 * 1024, 40 * 1024 * 1024 * 1024, '30-40 GB'),
+        (40 * 1024 * 1024 * 1024, 50 * 1024 * 1024 * 1024, '40-50 GB')
+    ]
+    df[new_column] = 'Empty'
+    for lower, upper, label in bins:
+        df.loc[(df[column] > lower) & (df[column] <= upper), new_column] = label
+    df.loc[df[column] > 50 * 1024 * 1024 * 1024, new_column] = '>50 GB'
+    return df
+
+# Original file-to-dataset aggregation from dataverse-file-assessment.ipynb (sum file sizes, sorted unique values for everything else, then 'true' substring matching for Boolean columns)
+def aggregate_files_lambda(df, sum_columns=('file_size',), bool_columns=()):
+    agg_funcs = {col: 'sum' if col in sum_columns else (lambda x: sorted(set(map(str, x)))) for col in df.columns if col != 'dataset_id'}
+    aggregated = df.groupby('dataset_id').agg(agg_funcs).reset_index()
+    for col in aggregated.columns:
+        if aggregated[col].apply(lambda x: isinstance(x, list)).any():
+            aggregated[col] = aggregated[col].apply(lambda x: '; '.join(map(str, x)))
+    aggregated = aggregated.drop_duplicates(subset='dataset_id', keep='first').copy()
+    for col in bool_columns:
+        aggregated[col] = aggregated[col].apply(lambda x: True if isinstance(x, str) and 'true' in x.lower() else False)
+    return aggregated
+
+# Original per-row classification from dataverse-file-assessment.ipynb (three file name searches, FORMAT_MAP lookup, one apply per format category)
+def classify_files_apply(df, config):
+    df = df.copy()
+    df['file_readme'] = df['file_name'].str.contains('readme|read_me', case=False)
+    df['file_codebook'] = df['file_name'].str.contains('codebook', case=False)
+    df['file_data_dict'] = df['file_name'].str.contains('dictionary', case=False)
+    format_map = config['FORMAT_MAP']
+    df['friendly_format_manual'] = df['file_mime_type'].apply(lambda x: format_map.get(x.strip(), x.strip()) if isinstance(x, str) and x != 'no match found' else 'no files')
+    for col, key in [('file_software', 'SOFTWARE_FORMATS'), ('file_compressed', 'COMPRESSED_FORMATS'), ('file_microsoft_office', 'MICROSOFT_FORMATS')]:
+        formats = set(config[key].keys())
+        df[col] = df['file_mime_type'].apply(lambda x: any(part.strip() in formats for part in x.split(';')) if isinstance(x, str) else False)
+    return df
+
+# Calendar flags the way the old get_day_of_week / is_us_federal_holiday / is_in_break helpers computed them, one row at a time
+def calendar_features_rowwise(values, ranges):
+    us_holidays = holidays.US()
+
+    def features(value):
+        try:
+            date = datetime.strptime(value, '%Y-%m-%d')
+        except Exception:
+            return None, False, False
+        in_break = any(pd.to_datetime(start) <= date <= pd.to_datetime(end) for start, end in ranges)
+        return date.strftime('%A'), date in us_holidays, in_break
+
+    return pd.DataFrame([features(value) for value in values], columns=['day_of_week', 'is_us_federal_holiday', 'is_in_break'], index=values.index)
+
+### Benchmarks ###
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def benchmark_flag_sensitive_terms(rows=100000):
+    columns = ['title', 'description', 'keywords']
+    df = make_metadata_frame(rows)
+    expected, reference_seconds = timed(flag_sensitive_terms_rowwise, df.copy(), sensitive_terms, columns)
+    result, seconds = timed(flag_sensitive_terms, df.copy(), sensitive_terms, columns)
+    pd.testing.assert_frame_equal(result, expected)
+    print(f'flag_sensitive_terms ({rows} rows): row-wise {reference_seconds:.2f}s, vectorized {seconds:.2f}s ({reference_seconds / seconds:.1f}x faster)\n')
+
+def benchmark_sensitive_screening(rows=300000):
+    df = make_file_frame(rows)
+    expected, reference_seconds = timed(lambda frame: add_final_source_column_rowwise(filter_sensitive_datasets(frame).copy()), df)
+    result, seconds = timed(screen_sensitive_datasets, df)
+    pd.testing.assert_frame_equal(result, expected)
+    print(f'sensitive screening ({rows} rows): filter + row-wise source {reference_seconds:.2f}s, single pass {seconds:.2f}s ({reference_seconds / seconds:.1f}x faster)\n')
+
+def benchmark_metadata_quality(rows=100000):
+    df = make_completeness_frame(rows)
+    expected, reference_seconds = timed(score_metadata_quality_rowwise, df)
+    result, seconds = timed(score_metadata_quality, df['title_reformatted'], df['description'], df['keywords'], nondescriptive_words)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+    print(f'metadata quality scoring ({rows} rows): row-wise {reference_seconds:.2f}s, batched {seconds:.2f}s ({reference_seconds / seconds:.1f}x faster)\n')
+
+def benchmark_size_bins(rows=100000):
+    df = make_file_size_frame(rows)
+    expected, reference_seconds = timed(assign_size_bins_loop, df)
+    result, seconds = timed(assign_size_bins, df.copy())
+    assert (result['file_size_bin'].astype(str).to_numpy() == expected['file_size_bin'].to_numpy()).all()
+    print(f'assign_size_bins ({rows} rows): mask per bin {reference_seconds:.2f}s, searchsorted {seconds:.2f}s ({reference_seconds / seconds:.1f}x faster)\n')
+
+def benchmark_extract_max_version(rows=100000):
+    values = make_version_series(rows)
+    expected, reference_seconds = timed(values.apply, extract_max_version)
+    result, seconds = timed(extract_max_versions, values)
+    pd.testing.assert_series_equal(result, expected)
+    print(f'extract_max_version ({rows} rows): apply {reference_seconds:.2f}s, vectorized {seconds:.2f}s ({reference_seconds / seconds:.1f}x faster)\n')
+
+def benchmark_safe_split(rows=100000):
+    values = make_delimited_series(rows)
+    _, seconds = timed(values.apply, safe_split)
+    print(f'safe_split ({rows} rows): {seconds:.2f}s\n')
+
+def benchmark_analyze_keywords(rows=100000):
+    keywords = make_completeness_frame(rows)['keywords']
+    _, seconds = timed(lambda values: values.apply(analyze_keywords, args=(nondescriptive_words,)), keywords)
+    print(f'analyze_keywords ({rows} rows): {seconds:.2f}s\n')
+
+def benchmark_file_aggregation(rows=100000):
+    df = make_file_entries_frame(rows)
+    bool_columns = ['file_readme', 'file_codebook', 'file_data_dict', 'file_software', 'file_compressed', 'file_microsoft_office', 'file_documentation']
+    expected, reference_seconds = timed(aggregate_files_lambda, df, ('file_size',), bool_columns)
+    result, seconds = timed(lambda frame: aggregate_files_to_datasets(frame, sum_columns=('file_size',), any_columns=bool_columns), df)
+    pd.testing.assert_frame_equal(result, expected.reset_index(drop=True))
+    print(f'file-to-dataset aggregation ({rows} rows, {df["dataset_id"].nunique()} datasets): groupby lambda {reference_seconds:.2f}s, aggregate_files_to_datasets {seconds:.2f}s ({reference_seconds / seconds:.1f}x faster)\n')
+
+def benchmark_file_classification(rows=100000):
+    with open('config.json') as f:
+        config = json.load(f)
+    df = make_file_entries_frame(rows)[['file_name', 'file_mime_type']]
+    ## Add some documentation file names and mime types from each format category
+    rng = np.random.default_rng(1)
+    names = np.array(['README.md', 'codebook.pdf', 'data_dictionary.xlsx', 'analysis.py'])
+    df['file_name'] = df['file_name'].where(rng.random(rows) > 0.1, names[rng.integers(0, len(names), rows)])
+    formats = np.array(list(config['FORMAT_MAP']) + ['no match found', 'application/zip; text/x-python'])
+    df['file_mime_type'] = df['file_mime_type'].where(rng.random(rows) > 0.5, formats[rng.integers(0, len(formats), rows)])
+    expected, reference_seconds = timed(classify_files_apply, df, config)
+
+    def classify(frame):
+        frame = frame.copy()
+        for flags in (flag_documentation_files(frame['file_name']), classify_mime_types(frame['file_mime_type'], config)):
+            for col in flags.columns:
+                frame[col] = flags[col]
+        return frame
+
+    result, seconds = timed(classify, df)
+    pd.testing.assert_frame_equal(result, expected)
+    print(f'file classification ({rows} rows, {df["file_mime_type"].nunique()} mime types): per-row {reference_seconds:.2f}s, classification index {seconds:.2f}s ({reference_seconds / seconds:.1f}x faster)\n')
+
+def benchmark_affiliation_matching(rows=100000):
+    df = make_author_pair_frame(rows)
+    ut_variations = ['University of Texas at Austin', 'UT Austin', 'UT-Austin', 'Dell Medical School', 'McCombs', 'Jackson School of Geosciences']
+    expected, reference_seconds = timed(lambda frame: frame.apply(determine_affiliation, axis=1, args=(ut_variations,)), df)
+    result, seconds = timed(determine_affiliations, df, ut_variations)
+    assert (result == expected).all()
+    print(f'affiliation matching ({rows} rows): row-wise apply {reference_seconds:.2f}s, compiled pattern per column {seconds:.2f}s ({reference_seconds / seconds:.1f}x faster)\n')
+
+# The row-by-row reference re-parses every break range on every row, so it only runs on the first 10k dates
+def benchmark_calendar_features(rows=100000):
+    values = make_date_series(rows)
+    ranges = [('2015-12-18', '2016-01-18'), ('2016-03-12', '2016-03-20'), ('2020-03-14', '2020-08-24'), ('2020-12-18', '2021-01-19'), ('2023-12-15', '2024-01-16')]
+    sample = values.iloc[:10000]
+    expected, reference_seconds = timed(calendar_features_rowwise, sample, ranges)
+    result, seconds = timed(calendar_features, values, ranges)
+    check = result.loc[sample.index]
+    assert (check['day_of_week'].astype(object).fillna('') == expected['day_of_week'].fillna('')).all()
+    pd.testing.assert_frame_equal(check[['is_us_federal_holiday', 'is_in_break']], expected[['is_us_federal_holiday', 'is_in_break']])
+    reference_seconds *= rows / len(sample)
+    print(f'calendar features ({rows} rows): row-wise {reference_seconds:.2f}s (extrapolated from {len(sample)} rows), calendar_features {seconds:.2f}s ({reference_seconds / seconds:.1f}x faster)\n')
+
+# Search API pagination against the fake server: one page at a time vs. pages of all institutions in flight at once
+def benchmark_search_pagination(rows=100000, institutions=4, per_page=100):
+    records = max(rows // 100, per_page)
+    server, base_url = start_fake_server()
+    url = f'{base_url}/api/search'
+    params_list = {f'inst{index}': {'q': str(records // institutions), 'subtree': f'inst{index}', 'type': 'dataset'} for index in range(institutions)}
+    try:
+        expected, serial_seconds = timed(lambda: retrieve_all_institutions(url, params_list, {}, 0, per_page))
+        result, seconds = timed(lambda: retrieve_all_institutions(url, params_list, {}, 0, per_page, max_workers=8, requests_per_second=1000))
+    finally:
+        server.shutdown()
+    assert result == expected
+    print(f'Search API pagination ({len(expected)} records, {institutions * math.ceil(records // institutions / per_page)} pages): serial {serial_seconds:.2f}s, concurrent {seconds:.2f}s ({serial_seconds / seconds:.1f}x faster)\n')
+
+# Native API retrieval (one request per DOI) against the fake server
+def benchmark_native_retrieval(rows=100000):
+    records = max(rows // 1000, 50)
+    server, base_url = start_fake_server()
+    dois = [f'10.18738/T8/{index:06d}' for index in range(records)]
+    try:
+        (results, failures), seconds = timed(lambda: retrieve_native_datasets(f'{base_url}/api/datasets/', dois, {}, max_workers=8, requests_per_second=1000))
+    finally:
+        server.shutdown()
+    assert len(results) == records and not failures
+    print(f'Native API retrieval ({records} datasets, {FakeAPIHandler.latency * 1000:.0f} ms per request): {seconds:.2f}s ({records * FakeAPIHandler.latency:.2f}s if serial)\n')
+
+# DataCite cursor pagination against the fake server (each page depends on the previous one's 'next' link)
+def benchmark_datacite_pagination(rows=100000, per_page=1000):
+    records = max(rows // 10, per_page)
+    server, base_url = start_fake_server()
+    try:
+        result, seconds = timed(lambda: list(iter_datacite(f'{base_url}/dois', {'page[size]': per_page, 'total': records}, 1, math.inf, per_page)))
+    finally:
+        server.shutdown()
+    assert len(result) == records
+    print(f'DataCite pagination ({records} records, {math.ceil(records / per_page)} pages): {seconds:.2f}s\n')
+
+# Crossref journal harvest against the fake server: one journal at a time with full records vs. concurrent cursor walks with select=
+def benchmark_journal_harvest(rows=100000, journals=8, per_page=100):
+    records = max(rows // 100 // journals, per_page)
+    server, base_url = start_fake_server()
+    journal_list = {f'Journal {index}': f'1234-{index:04d}' for index in range(journals)}
+    params = {'filter': 'from-pub-date:2020-01-01', 'rows': per_page, 'total': records}
+    select = ['DOI', 'title', 'published', 'author']
+    try:
+        expected, reference_seconds = timed(lambda: retrieve_all_journals(f'{base_url}/journals/{{issn}}/works', journal_list, params, math.inf, max_workers=1, requests_per_second=1000))
+        result, seconds = timed(lambda: retrieve_all_journals(f'{base_url}/journals/{{issn}}/works', journal_list, params, math.inf, select=select, max_workers=journals, requests_per_second=1000))
+    finally:
+        server.shutdown()
+    assert [item['DOI'] for item in result] == [item['DOI'] for item in expected]
+    assert result == [{field: item[field] for field in select} for item in expected]
+    full_mb = len(json.dumps(expected)) / 1024 ** 2
+    selected_mb = len(json.dumps(result)) / 1024 ** 2
+    print(f'Crossref journal harvest ({journals} journals, {len(result)} works): serial full records {reference_seconds:.2f}s ({full_mb:.1f} MB), concurrent with select {seconds:.2f}s ({selected_mb:.1f} MB) ({reference_seconds / seconds:.1f}x faster)\n')
+
+benchmarks = {
+    'flag_sensitive_terms': benchmark_flag_sensitive_terms,
+    'sensitive_screening': benchmark_sensitive_screening,
+    'metadata_quality': benchmark_metadata_quality,
+    'size_bins': benchmark_size_bins,
+    'extract_max_version': benchmark_extract_max_version,
+    'safe_split': benchmark_safe_split,
+    'analyze_keywords': benchmark_analyze_keywords,
+    'file_classification': benchmark_file_classification,
+    'file_aggregation': benchmark_file_aggregation,
+    'calendar_features': benchmark_calendar_features,
+    'affiliation_matching': benchmark_affiliation_matching,
+    'search_pagination': benchmark_search_pagination,
+    'native_retrieval': benchmark_native_retrieval,
+    'datacite_pagination': benchmark_datacite_pagination,
+    'journal_harvest': benchmark_journal_harvest,
+}
+sizes = {'small': 1000, 'medium': 100000, 'large': 1000000}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks for utils.py')
+    parser.add_argument('--size', choices=sizes, default='medium', help='number of synthetic rows (1k, 100k, or 1M); the row-by-row reference implementations are slow at 1M')
+    parser.add_argument('--only', nargs='+', choices=benchmarks, help='benchmarks to run (default: all)')
+    args = parser.parse_args()
+    for name in args.only or benchmarks:
+        benchmarks[name](sizes[args.size])
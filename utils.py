@@ -1,33 +1,360 @@
+import ast
+import csv
+import gzip
+import hashlib
 import holidays
+import inspect
+import io
+import json
 import math
+import multiprocessing
 import numpy as np
 import os
 import pandas as pd
+import random
 import re
 import requests
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from contextlib import contextmanager
 from datetime import datetime
 from dotenv import load_dotenv
-from urllib.parse import urlparse, parse_qs
+from requests.adapters import HTTPAdapter
+from urllib.parse import quote, urlencode, urlparse, parse_qs
 
 load_dotenv()
 
 def env_bool(key, default=False):
     return os.environ.get(key, str(default)).strip().lower() in ('true', '1', 'yes')
 
+### Run metrics functions ###
+
+# Collects per-stage wall/CPU time, peak memory, and HTTP request statistics for one run
+## Stages don't nest (starting a stage ends the previous one); requests made by worker threads count toward the running stage
+## profile=True also runs cProfile during each stage (it only sees the thread that started the stage, not the request workers)
+latency_buckets_ms = [50, 100, 250, 500, 1000, 2500, 5000, 10000]
+class RunMetrics:
+    def __init__(self, profile=False):
+        self.profile = profile
+        self.started = datetime.now()
+        self.lock = threading.Lock()
+        self.stages = []
+        self.current = None
+        self.stage_start = None
+        self.profiler = None
+        self.profiles = {}
+        ## Requests made between stages are still counted
+        self.outside = self.new_stage('(outside stages)')
+
+    def new_stage(self, name):
+        return {'name': name, 'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'peak_rss_mb': None, 'requests': 0, 'cache_hits': 0, 'timeouts': 0, 'errors': 0, 'retries': 0, 'bytes_downloaded': 0, 'status_codes': {}, 'latencies_ms': []}
+
+    def begin_stage(self, name):
+        self.end_stage()
+        stage = self.new_stage(name)
+        if self.profile:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        with self.lock:
+            self.stages.append(stage)
+            self.current = stage
+        self.stage_start = (time.perf_counter(), time.process_time())
+        return stage
+
+    def end_stage(self):
+        if self.current is None:
+            return
+        wall_start, cpu_start = self.stage_start
+        with self.lock:
+            stage = self.current
+            self.current = None
+        stage['wall_seconds'] = round(time.perf_counter() - wall_start, 3)
+        stage['cpu_seconds'] = round(time.process_time() - cpu_start, 3)
+        stage['peak_rss_mb'] = peak_rss_mb()
+        if self.profiler:
+            self.profiler.disable()
+            self.profiles[stage['name']] = self.profiler
+            self.profiler = None
+
+    # Records one request: a cache hit, a response (status and size), or a timeout/error raised before a response arrived
+    def record_request(self, seconds=None, status=None, size=0, cache_hit=False, outcome=None):
+        with self.lock:
+            stage = self.current or self.outside
+            stage['requests'] += 1
+            if cache_hit:
+                stage['cache_hits'] += 1
+                return
+            if outcome == 'timeout':
+                stage['timeouts'] += 1
+            elif outcome == 'error':
+                stage['errors'] += 1
+            if status is not None:
+                stage['status_codes'][str(status)] = stage['status_codes'].get(str(status), 0) + 1
+            stage['bytes_downloaded'] += size
+            if seconds is not None:
+                stage['latencies_ms'].append(seconds * 1000)
+
+    def record_retry(self):
+        with self.lock:
+            (self.current or self.outside)['retries'] += 1
+
+    # Summarizes each stage, replacing the raw latencies with percentiles and a histogram (counts per bucket, in ms)
+    def report(self):
+        stages = []
+        for stage in [*self.stages, self.outside]:
+            if stage is self.outside and not stage['requests']:
+                continue
+            summary = {key: value for key, value in stage.items() if key != 'latencies_ms'}
+            latencies = np.array(stage['latencies_ms'])
+            if latencies.size:
+                summary['latency_ms'] = {
+                    'p50': round(float(np.percentile(latencies, 50)), 1),
+                    'p95': round(float(np.percentile(latencies, 95)), 1),
+                    'max': round(float(latencies.max()), 1),
+                    'histogram': dict(zip([f'<={edge}' for edge in latency_buckets_ms] + [f'>{latency_buckets_ms[-1]}'], np.bincount(np.searchsorted(latency_buckets_ms, latencies), minlength=len(latency_buckets_ms) + 1).tolist())),
+                }
+            stages.append(summary)
+        return {
+            'started': self.started.isoformat(timespec='seconds'),
+            'finished': datetime.now().isoformat(timespec='seconds'),
+            'total_wall_seconds': round((datetime.now() - self.started).total_seconds(), 3),
+            'peak_rss_mb': peak_rss_mb(),
+            'stages': stages,
+        }
+
+    # Writes the run report as JSON (and, if profiling, one .prof file per stage in profile_dir) and prints a summary table
+    def write_report(self, path, profile_dir=None):
+        self.end_stage()
+        report = self.report()
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        if self.profiles and profile_dir:
+            os.makedirs(profile_dir, exist_ok=True)
+            for name, profiler in self.profiles.items():
+                profiler.dump_stats(os.path.join(profile_dir, f"{os.path.splitext(os.path.basename(path))[0]}_{re.sub(r'[^A-Za-z0-9]+', '-', name).strip('-')}.prof"))
+        print(f"{'Stage':<32}{'Wall (s)':>10}{'CPU (s)':>10}{'Requests':>10}{'Cached':>8}{'Failed':>8}{'MB':>8}{'p95 (ms)':>10}")
+        for stage in report['stages']:
+            failed = stage['timeouts'] + stage['errors'] + sum(count for status, count in stage['status_codes'].items() if int(status) >= 400)
+            print(f"{stage['name'][:31]:<32}{stage['wall_seconds']:>10.1f}{stage['cpu_seconds']:>10.1f}{stage['requests']:>10}{stage['cache_hits']:>8}{failed:>8}{stage['bytes_downloaded'] / 1e6:>8.1f}{stage.get('latency_ms', {}).get('p95', 0):>10.0f}")
+        print(f'\nRun report saved to {path}\n')
+        return report
+
+# Peak memory (resident set size) of the process so far in MB (None where the resource module isn't available, e.g. Windows)
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    ## ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+# Module-level collector used by stage() and the HTTP layer once enabled
+run_metrics = None
+def enable_run_metrics(profile=False):
+    global run_metrics
+    run_metrics = RunMetrics(profile)
+    return run_metrics
+def disable_run_metrics():
+    global run_metrics
+    run_metrics = None
+
+# Times a block or function as a named stage (no-op unless run metrics are enabled)
+## Usable as `with stage('parse'):` or `@stage('parse')`
+@contextmanager
+def stage(name):
+    if run_metrics is None:
+        yield
+        return
+    run_metrics.begin_stage(name)
+    try:
+        yield
+    finally:
+        run_metrics.end_stage()
+
+# Hooks for the HTTP layer
+def record_request(**kwargs):
+    if run_metrics is not None:
+        run_metrics.record_request(**kwargs)
+def record_retry():
+    if run_metrics is not None:
+        run_metrics.record_retry()
+
+### HTTP caching functions ###
+
+# On-disk (SQLite) cache of JSON API responses, keyed by URL + params + request headers
+## ttl_hours maps URL substrings (e.g. '/versions', 'api.datacite.org') to hours before an entry is stale; 'default' covers everything else
+## Stale entries with an ETag or Last-Modified are revalidated with a conditional request; refresh=True ignores existing entries
+class ResponseCache:
+    def __init__(self, directory='cache', max_size_mb=2048, ttl_hours=None, refresh=False):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, 'responses.sqlite')
+        self.max_size = max_size_mb * 1024 * 1024
+        self.ttl_hours = ttl_hours or {'default': 24}
+        self.refresh = refresh
+        self.lock = threading.Lock()
+        self.stores_since_eviction = 0
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, url TEXT, body BLOB, etag TEXT, last_modified TEXT, '
+            'fetched_at REAL, accessed_at REAL, size INTEGER)'
+        )
+        self.connection.commit()
+
+    def make_key(self, url, params=None, headers=None):
+        parts = [url, sorted((params or {}).items()), sorted((headers or {}).items())]
+        return hashlib.sha256(json.dumps(parts, default=str).encode('utf-8')).hexdigest()
+
+    def ttl_for(self, url):
+        for pattern, hours in self.ttl_hours.items():
+            if pattern != 'default' and pattern in url:
+                return hours * 3600
+        return self.ttl_hours.get('default', 24) * 3600
+
+    # Returns the cached entry (with a 'fresh' flag) or None
+    def lookup(self, key, url):
+        if self.refresh:
+            return None
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT body, etag, last_modified, fetched_at FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.connection.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (time.time(), key))
+            self.connection.commit()
+            body, etag, last_modified, fetched_at = row
+            fresh = time.time() - fetched_at < self.ttl_for(url)
+            if fresh:
+                self.hits += 1
+        return {
+            'data': json.loads(zlib.decompress(body)),
+            'etag': etag,
+            'last_modified': last_modified,
+            'fresh': fresh
+        }
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    # Marks a stale entry as fresh again after a 304 Not Modified
+    def revalidate(self, key):
+        now = time.time()
+        with self.lock:
+            self.revalidations += 1
+            self.connection.execute('UPDATE responses SET fetched_at = ?, accessed_at = ? WHERE key = ?', (now, now, key))
+            self.connection.commit()
+
+    def store(self, key, url, response, data):
+        body = zlib.compress(json.dumps(data).encode('utf-8'))
+        now = time.time()
+        with self.lock:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, url, body, response.headers.get('ETag'), response.headers.get('Last-Modified'), now, now, len(body))
+            )
+            self.connection.commit()
+            self.stores_since_eviction += 1
+            if self.stores_since_eviction >= 100:
+                self.stores_since_eviction = 0
+                self.evict()
+
+    # Deletes least recently used entries until the cache is under its size limit (call with lock held)
+    def evict(self):
+        total = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_size:
+            return
+        to_delete = []
+        for key, size in self.connection.execute('SELECT key, size FROM responses ORDER BY accessed_at'):
+            if total <= self.max_size:
+                break
+            to_delete.append((key,))
+            total -= size
+        self.connection.executemany('DELETE FROM responses WHERE key = ?', to_delete)
+        self.connection.commit()
+
+    def clear(self):
+        with self.lock:
+            self.connection.execute('DELETE FROM responses')
+            self.connection.commit()
+
+    def summary(self):
+        return {'hits': self.hits, 'revalidated': self.revalidations, 'misses': self.misses}
+
+# Module-level cache used by every retrieval function once enabled
+response_cache = None
+def enable_response_cache(directory='cache', max_size_mb=2048, ttl_hours=None, refresh=False):
+    global response_cache
+    response_cache = ResponseCache(directory, max_size_mb, ttl_hours, refresh)
+    print(f'Caching API responses in {response_cache.path}' + (' (refreshing all entries)' if refresh else '') + '\n')
+    return response_cache
+def disable_response_cache():
+    global response_cache
+    response_cache = None
+
+# Retrieves JSON from a URL through the response cache (if enabled)
+## Raises requests exceptions like requests.get + raise_for_status would
+def cached_get_json(url, params=None, headers=None, timeout=None, session=None, rate_limiter=None):
+    cache = response_cache
+    request_headers = dict(headers or {})
+    entry = None
+    if cache:
+        key = cache.make_key(url, params, {**(session.headers if session else {}), **request_headers})
+        entry = cache.lookup(key, url)
+        if entry and entry['fresh']:
+            record_request(cache_hit=True)
+            return entry['data']
+        if entry:
+            request_headers.update(cache.conditional_headers(entry))
+    if rate_limiter:
+        rate_limiter.acquire()
+    get = session.get if session else requests.get
+    started = time.perf_counter()
+    try:
+        response = get(url, params=params, headers=request_headers or None, timeout=timeout)
+    except requests.exceptions.Timeout:
+        record_request(seconds=time.perf_counter() - started, outcome='timeout')
+        raise
+    except requests.exceptions.RequestException:
+        record_request(seconds=time.perf_counter() - started, outcome='error')
+        raise
+    record_request(seconds=time.perf_counter() - started, status=response.status_code, size=len(response.content))
+    if response.status_code == 304 and entry:
+        cache.revalidate(key)
+        return entry['data']
+    response.raise_for_status()
+    data = response.json()
+    if cache:
+        cache.store(key, url, response, data)
+    return data
+
 ### API retrieval functions ###
 
 # Retrieves single page of Dryad results
 def retrieve_page_dryad(url, params):
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        return response.json()
+        return cached_get_json(url, params=params)
     except requests.RequestException as e:
         print(f'Error retrieving page: {e}')
         return {'_embedded': {'stash:datasets': []}, 'total': {}}
-# Retrieves all pages of Dryad results
-def retrieve_dryad(url, params, page_start, per_page):
-    all_data_dryad = []
+# Yields records from all pages of Dryad results as they arrive
+def iter_dryad(url, params, page_start, per_page):
     params = params.copy()
     params['page'] = page_start
     params['per_page'] = per_page
@@ -44,39 +371,37 @@ def retrieve_dryad(url, params, page_start, per_page):
 
         if not data.get('_embedded'):
             print('No data found.')
-            return all_data_dryad
+            return
 
         datasets = data['_embedded'].get('stash:datasets', [])
-        all_data_dryad.extend(datasets)
+        yield from datasets
 
         params['page'] += 1
 
         if not datasets:
             print('End of Dryad response.\n')
             break
-
-    return all_data_dryad
+## Collects all records into a list
+def retrieve_dryad(url, params, page_start, per_page):
+    return list(iter_dryad(url, params, page_start, per_page))
 
 # Retrieves single page of DataCite results
 def retrieve_page_datacite(url, params=None):
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        return response.json()
+        return cached_get_json(url, params=params)
     except requests.RequestException as e:
         print(f'Error retrieving page: {e}')
         return {'data': [], 'links': {}}
-# Retrieves all pages of DataCite results
-def retrieve_datacite(url, params, page_start, page_limit, per_page):
-    all_data_datacite = []
+# Yields records from all pages of DataCite results as they arrive
+def iter_datacite(url, params, page_start, page_limit, per_page):
     current_page = page_start
 
     data = retrieve_page_datacite(url, params)
     if not data['data']:
         print('No data found.')
-        return all_data_datacite
+        return
 
-    all_data_datacite.extend(data['data'])
+    yield from data['data']
 
     total_count = data.get('meta', {}).get('total', 0)
     total_pages = math.ceil(total_count / per_page) if per_page else 1
@@ -90,10 +415,11 @@ def retrieve_datacite(url, params, page_start, page_limit, per_page):
         if not data['data']:
             print('End of response.')
             break
-        all_data_datacite.extend(data['data'])
+        yield from data['data']
         current_url = data.get('links', {}).get('next', None)
-
-    return all_data_datacite
+## Collects all records into a list
+def retrieve_datacite(url, params, page_start, page_limit, per_page):
+    return list(iter_datacite(url, params, page_start, page_limit, per_page))
 # Retrieves all pages of DataCite aggregate metadata
 def retrieve_datacite_summary(url, params, publisher, affiliated, institution):
     all_resource_types = []
@@ -125,24 +451,12 @@ def retrieve_datacite_summary(url, params, publisher, affiliated, institution):
 # Retrieves single page of Dataverse results
 def retrieve_page_dataverse(url, params=None, headers=None):
     try:
-        response = requests.get(url, params=params, headers=headers)
-        response.raise_for_status()
-        return response.json()
-    except requests.RequestException as e:
-        print(f'Error retrieving page: {e}')
-        return {'data': {'items': [], 'total_count': 0}}
-# Retrieves all pages of DataCite results
-def retrieve_page_dataverse(url, params=None, headers=None):
-    try:
-        response = requests.get(url, params=params, headers=headers)
-        response.raise_for_status()
-        return response.json()
+        return cached_get_json(url, params=params, headers=headers)
     except requests.RequestException as e:
         print(f'Error retrieving page: {e}')
         return {'data': {'items': [], 'total_count': 0}}
-# Retrieves all pages of DataCite results
-def retrieve_dataverse(url, params, headers, page_start, per_page, page_limit=None):
-    all_data_dataverse = []
+# Yields records from all pages of Dataverse results as they arrive
+def iter_dataverse(url, params, headers, page_start, per_page, page_limit=None):
     params = params.copy()
     current_page = 0
     adjusted_page = current_page + 1
@@ -160,7 +474,7 @@ def retrieve_dataverse(url, params, headers, page_start, per_page, page_limit=No
             print('No data found.')
             break
 
-        all_data_dataverse.extend(data['data']['items'])
+        yield from data['data']['items']
 
         # Pagination logic
         current_page += 1
@@ -173,10 +487,14 @@ def retrieve_dataverse(url, params, headers, page_start, per_page, page_limit=No
         if page_limit and current_page >= page_limit:
             print('Reached page limit.\n')
             break
-
-    return all_data_dataverse
+## Collects all records into a list
+def retrieve_dataverse(url, params, headers, page_start, per_page, page_limit=None):
+    return list(iter_dataverse(url, params, headers, page_start, per_page, page_limit))
 ## Retrieves many pages from many institutions
-def retrieve_all_institutions(url, params_list, headers, page_start, per_page, page_limit = None):
+## Passing max_workers (e.g., **config['VARIABLES']['CONCURRENCY']) retrieves institutions and pages concurrently
+def retrieve_all_institutions(url, params_list, headers, page_start, per_page, page_limit = None, max_workers=None, **kwargs):
+    if max_workers:
+        return retrieve_all_institutions_concurrent(url, params_list, headers, page_start, per_page, page_limit, max_workers=max_workers, **kwargs)
     all_data = []
 
     for institution_name, params in params_list.items():
@@ -187,14 +505,20 @@ def retrieve_all_institutions(url, params_list, headers, page_start, per_page, p
             all_data.append(entry)
 
     return all_data
+# Retrieves single page of Zenodo results
+def retrieve_page_zenodo(url, params=None):
+    try:
+        return cached_get_json(url, params=params)
+    except requests.RequestException as e:
+        print(f'Error retrieving page: {e}')
+        return {'hits': {'hits': [], 'total': 0}, 'links': {}}
 # Retrieves page number in Zenodo query
 def extract_page_number(url):
     parsed_url = urlparse(url)
     query_params = parse_qs(parsed_url.query)
     return query_params.get('page', [None])[0]
-# Retrieves all pages of Zenodo results
-def retrieve_zenodo(url, params, page_start, page_limit, per_page):
-    all_data_zenodo = []
+# Yields records from all pages of Zenodo results as they arrive
+def iter_zenodo(url, params, page_start, page_limit, per_page):
     current_page = page_start
     params = params.copy()
     params['page'] = current_page
@@ -203,9 +527,9 @@ def retrieve_zenodo(url, params, page_start, page_limit, per_page):
     data = retrieve_page_zenodo(url, params)
     if not data['hits']['hits']:
         print('No data found.')
-        return all_data_zenodo
+        return
 
-    all_data_zenodo.extend(data['hits']['hits'])
+    yield from data['hits']['hits']
 
     current_url = data.get('links', {}).get('self', None)
     total_count = data.get('hits', {}).get('total', 0)
@@ -220,49 +544,55 @@ def retrieve_zenodo(url, params, page_start, page_limit, per_page):
             print('End of Zenodo response.\n')
             break
 
-        all_data_zenodo.extend(data['hits']['hits'])
+        yield from data['hits']['hits']
         current_url = data.get('links', {}).get('next', None)
+## Collects all records into a list
+def retrieve_zenodo(url, params, page_start, page_limit, per_page):
+    return list(iter_zenodo(url, params, page_start, page_limit, per_page))
 
-    return all_data_zenodo
+# Adds a field projection (the select= parameter of OpenAlex and Crossref) to query parameters
+## select is a list of field names or a comma-separated string; only those fields of each record are sent back
+def with_select(params, select=None):
+    params = params.copy()
+    if select:
+        params['select'] = select if isinstance(select, str) else ','.join(select)
+    return params
 
 # Retrieves single page of OpenAlex results
-def retrieve_page_openalex(url, params=None):
+def retrieve_page_openalex(url, params=None, rate_limiter=None):
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        return response.json()
+        return cached_get_json(url, params=params, rate_limiter=rate_limiter)
     except requests.RequestException as e:
         print(f'Error retrieving page: {e}')
         return {'results': [], 'meta': {}}
-# Retrieves all pages of OpenAlex results
-def retrieve_openalex(url, params, page_limit):
-    all_data_openalex = []
-    params = params.copy()
+# Yields records from all pages of OpenAlex results as they arrive
+def iter_openalex(url, params, page_limit, select=None, rate_limiter=None):
+    params = with_select(params, select)
     params['cursor'] = '*'
-    next_cursor = '*'
-    previous_cursor = None
     current_page = 0
 
-    data = retrieve_page_openalex(url, params)
+    data = retrieve_page_openalex(url, params, rate_limiter)
     if not data['results']:
         print('No data found.')
-        return all_data_openalex
+        return
 
-    all_data_openalex.extend(data['results'])
+    yield from data['results']
 
     total_count = data.get('meta', {}).get('count', 0)
     per_page = data.get('meta', {}).get('per_page', 1)
     total_pages = math.ceil(total_count / per_page) + 1
 
     print(f'Total: {total_count} entries over {total_pages} pages\n')
+    ## The next request continues from the first page's cursor (rather than asking for the first page again)
+    params['cursor'] = data.get('meta', {}).get('next_cursor', None)
 
-    while current_page < page_limit:
+    while params['cursor'] and current_page < page_limit:
         current_page += 1
         print(f'Retrieving page {current_page} of {total_pages} from OpenAlex...\n')
-        data = retrieve_page_openalex(url, params)
+        data = retrieve_page_openalex(url, params, rate_limiter)
         next_cursor = data.get('meta', {}).get('next_cursor', None)
 
-        if next_cursor == previous_cursor:
+        if next_cursor == params['cursor']:
             print('Cursor did not change. Ending loop to avoid infinite loop.')
             break
 
@@ -270,66 +600,1237 @@ def retrieve_openalex(url, params, page_limit):
             print('End of OpenAlex response.\n')
             break
 
-        all_data_openalex.extend(data['results'])
+        yield from data['results']
 
-        previous_cursor = next_cursor
         params['cursor'] = next_cursor
-
-    return all_data_openalex
+## Collects all records into a list
+def retrieve_openalex(url, params, page_limit, select=None, rate_limiter=None):
+    return list(iter_openalex(url, params, page_limit, select, rate_limiter))
 
 # Retrieves single page of Crossref results
-def retrieve_page_crossref(url, params=None):
+def retrieve_page_crossref(url, params=None, rate_limiter=None):
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        return response.json()
+        return cached_get_json(url, params=params, rate_limiter=rate_limiter)
     except requests.RequestException as e:
         print(f'Error retrieving page: {e}')
         return {'message': {'items': [], 'total-results': {}}}
-# Retrieves all pages of Crossref results
-def retrieve_crossref(url, params, page_limit):
-    all_data_crossref = []
-    params = params.copy()
+# Yields records from all pages of Crossref results as they arrive
+def iter_crossref(url, params, page_limit, select=None, rate_limiter=None):
+    params = with_select(params, select)
     params['cursor'] = '*'
-    next_cursor = '*'
-    previous_cursor = None
     current_page = 1
 
-    data = retrieve_page_crossref(url, params)
+    data = retrieve_page_crossref(url, params, rate_limiter)
     if not data['message']['items']:
         print('No data found.')
-        return all_data_crossref
+        return
 
-    all_data_crossref.extend(data['message']['items'])
+    yield from data['message']['items']
+    ## The next request continues from the first page's cursor (rather than asking for the first page again)
+    params['cursor'] = data.get('message', {}).get('next-cursor', None)
 
-    while current_page < page_limit:
+    while params['cursor'] and current_page < page_limit:
         current_page += 1
         print(f'Retrieving page {current_page} from CrossRef...\n')
-        data = retrieve_page_crossref(url, params)
+        data = retrieve_page_crossref(url, params, rate_limiter)
         next_cursor = data.get('message', {}).get('next-cursor', None)
 
         if not data['message']['items']:
             print('Finished retrieval.\n')
             break
 
-        all_data_crossref.extend(data['message']['items'])
+        yield from data['message']['items']
 
-        previous_cursor = next_cursor
         params['cursor'] = next_cursor
-
-    return all_data_crossref
+## Collects all records into a list
+def retrieve_crossref(url, params, page_limit, select=None, rate_limiter=None):
+    return list(iter_crossref(url, params, page_limit, select, rate_limiter))
 # Retrieves results for specified journals in Crossref API
-def retrieve_all_journals(url_template, journal_list, params_crossref_journal, page_limit_crossref, retrieve_crossref_func):
-    all_data = []
-    for journal_name, issn in journal_list.items():
+## Each journal's cursor walk runs in its own thread, all under one shared rate limit; the defaults stay within Crossref's polite pool (add a mailto parameter to be in it)
+## Results keep the order of journal_list; select limits each work record to the listed fields
+## retrieve_crossref_func is called as func(url, params, page_limit); select and the shared limiter are only passed to functions that accept them
+## (a function without a rate_limiter parameter takes a token from the shared limiter before each journal instead)
+def retrieve_all_journals(url_template, journal_list, params_crossref_journal, page_limit_crossref, retrieve_crossref_func=retrieve_crossref, select=None, max_workers=3, requests_per_second=10):
+    rate_limiter = RateLimiter(requests_per_second)
+    parameters = inspect.signature(retrieve_crossref_func).parameters
+    accepts_keywords = any(parameter.kind == inspect.Parameter.VAR_KEYWORD for parameter in parameters.values())
+    passes_limiter = accepts_keywords or 'rate_limiter' in parameters
+    options = {'rate_limiter': rate_limiter} if passes_limiter else {}
+    if select is not None:
+        options['select'] = select
+
+    def retrieve_journal(journal_name, issn):
         print(f'Retrieving data from {journal_name} (ISSN: {issn})')
         custom_url = url_template.format(issn=issn)
         params = params_crossref_journal.copy()
         params['filter'] += f',issn:{issn}'
-        journal_data = retrieve_crossref_func(custom_url, params, page_limit_crossref)
-        all_data.extend(journal_data)
+        if not passes_limiter:
+            rate_limiter.acquire()
+        return retrieve_crossref_func(custom_url, params, page_limit_crossref, **options)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        journal_data = list(executor.map(retrieve_journal, journal_list.keys(), journal_list.values()))
+    return [item for items in journal_data for item in items]
+
+### Record streaming functions ###
+
+# Passes records from an iter_* generator through a projection function and yields DataFrames of at most chunk_size rows
+## The projection returns one row (dict), several rows (list of dicts), or None to skip the record
+## Only one chunk of rows is held in memory at a time, regardless of the size of the harvest
+def iter_record_chunks(records, projection, chunk_size=10000):
+    rows = []
+    for record in records:
+        projected = projection(record)
+        if projected is None:
+            continue
+        if isinstance(projected, dict):
+            rows.append(projected)
+        else:
+            rows.extend(projected)
+        if len(rows) >= chunk_size:
+            yield pd.DataFrame(rows)
+            rows = []
+    if rows:
+        yield pd.DataFrame(rows)
+
+# Collects projected records into a single DataFrame (raw records are discarded as each chunk is built)
+def stream_to_dataframe(records, projection, chunk_size=10000):
+    chunks = list(iter_record_chunks(records, projection, chunk_size))
+    if not chunks:
+        return pd.DataFrame()
+    return pd.concat(chunks, ignore_index=True)
+
+# Writes projected records to a Parquet file, one row group per chunk
+## Requires pyarrow; the schema is fixed by the first chunk unless one is passed in
+def stream_to_parquet(records, projection, path, chunk_size=10000, schema=None):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        print('pyarrow is not installed; cannot write Parquet output.\n')
+        return 0
+    writer = None
+    total_rows = 0
+    try:
+        for chunk in iter_record_chunks(records, projection, chunk_size):
+            table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+            if writer is None:
+                schema = table.schema
+                writer = pq.ParquetWriter(path, schema)
+            writer.write_table(table)
+            total_rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    print(f'Wrote {total_rows} rows to {path}\n')
+    return total_rows
+
+### Checkpoint functions ###
+
+# Append-only JSONL journal of successful responses for one harvest stage, so an interrupted run can resume where it stopped
+## Each line holds an identifier (DOI, dataset ID, collection alias, ...) and its response; resume=False starts the journal over
+class CheckpointJournal:
+    def __init__(self, path, resume=True):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        if not resume and os.path.exists(path):
+            os.remove(path)
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            for line in content.splitlines():
+                ## A line cut off by a crash is skipped (and retrieved again)
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self.entries[self.make_key(entry['identifier'])] = entry['data']
+            if content and not content.endswith('\n'):
+                with open(path, 'a', encoding='utf-8') as f:
+                    f.write('\n')
+
+    def make_key(self, identifier):
+        return json.dumps(identifier, default=str)
+
+    def __contains__(self, identifier):
+        return self.make_key(identifier) in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, identifier):
+        return self.entries.get(self.make_key(identifier))
+
+    def append(self, identifier, data):
+        line = json.dumps({'identifier': identifier, 'data': data}, default=str)
+        with self.lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+            self.entries[self.make_key(identifier)] = data
+
+# Opens the journal for one stage of the run on a given date (logs/checkpoints/{today}_{stage}.jsonl)
+def open_checkpoint_journal(logs_dir, today, stage, resume=True):
+    directory = os.path.join(logs_dir, 'checkpoints')
+    os.makedirs(directory, exist_ok=True)
+    journal = CheckpointJournal(os.path.join(directory, f'{today}_{stage}.jsonl'), resume)
+    if len(journal):
+        print(f'Resuming {stage}: {len(journal)} responses already retrieved on this date.\n')
+    return journal
+
+### Concurrent retrieval functions ###
+
+# Token bucket shared by all worker threads to cap requests per second
+class RateLimiter:
+    def __init__(self, requests_per_second, burst=1):
+        self.rate = requests_per_second
+        self.capacity = max(1, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+# Creates a session whose connection pool is large enough for the thread pool
+def create_session(headers=None, pool_size=10):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if headers:
+        session.headers.update(headers)
+    return session
+
+# Retrieves JSON from a single URL, retrying timeouts, dropped connections, 429s and 5xx errors with jittered exponential backoff
+## Returns (json, None) on success and (None, reason) on failure; cached responses do not count against the rate limit
+retry_status_codes = {429, 500, 502, 503, 504}
+def fetch_json(session, url, params=None, timeout=10, max_retries=3, backoff=1.0, rate_limiter=None):
+    reason = None
+    for attempt in range(max_retries + 1):
+        if attempt:
+            record_retry()
+            time.sleep(backoff * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5))
+        try:
+            return cached_get_json(url, params=params, timeout=timeout, session=session, rate_limiter=rate_limiter), None
+        except requests.exceptions.Timeout:
+            reason = f'Timeout after {timeout}s'
+        except requests.exceptions.ConnectionError as e:
+            reason = f'Connection error: {e}'
+        except requests.exceptions.HTTPError as e:
+            reason = f'Status {e.response.status_code}'
+            if e.response.status_code not in retry_status_codes:
+                return None, reason
+        except requests.exceptions.JSONDecodeError:
+            return None, 'Invalid JSON in response'
+        except requests.exceptions.RequestException as e:
+            return None, str(e)
+    return None, f'{reason} (gave up after {max_retries + 1} attempts)'
+
+# Retrieves JSON for many identifiers concurrently under a shared rate limit
+## Results are returned in the same order as the identifiers (None where retrieval failed), along with a list of failures
+## With a CheckpointJournal, identifiers already in the journal are not requested again and each new response is journaled
+def fetch_concurrent(identifiers, url_func, headers=None, max_workers=8, requests_per_second=5, timeout=10, max_retries=3, backoff=1.0, label='record', session=None, rate_limiter=None, journal=None):
+    identifiers = list(identifiers)
+    total = len(identifiers)
+    session = session or create_session(headers, pool_size=max_workers)
+    rate_limiter = rate_limiter or RateLimiter(requests_per_second)
+    results = [None] * total
+    failures = []
+    completed = [0]
+    progress_lock = threading.Lock()
+    progress_step = max(1, total // 20)
+
+    def worker(position, identifier):
+        data, reason = fetch_json(session, url_func(identifier), timeout=timeout, max_retries=max_retries, backoff=backoff, rate_limiter=rate_limiter)
+        with progress_lock:
+            if data is None:
+                failures.append({'identifier': identifier, 'reason': reason})
+            else:
+                results[position] = data
+                if journal is not None:
+                    journal.append(identifier, data)
+            completed[0] += 1
+            if completed[0] % progress_step == 0 or completed[0] == total:
+                print(f'Retrieved {completed[0]} of {total} {label}s ({len(failures)} failed)\n')
+
+    remaining = list(range(total))
+    if journal is not None:
+        for position, identifier in enumerate(identifiers):
+            if identifier in journal:
+                results[position] = journal.get(identifier)
+        remaining = [position for position in remaining if results[position] is None]
+        completed[0] = total - len(remaining)
+        if completed[0]:
+            print(f'{completed[0]} of {total} {label}s loaded from the checkpoint journal\n')
+
+    print(f'Retrieving {len(remaining)} {label}s with {max_workers} workers at up to {requests_per_second} requests per second\n')
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(worker, remaining, [identifiers[position] for position in remaining]))
+
+    return results, failures
+
+# Retrieves Native API metadata for a list of dataset DOIs
+def retrieve_native_datasets(url, dois, headers, **kwargs):
+    results, failures = fetch_concurrent(
+        dois,
+        lambda doi: f'{url}:persistentId/?persistentId=doi:{doi}',
+        headers=headers,
+        label='dataset',
+        **kwargs
+    )
+    return [result for result in results if result is not None], failures
+
+# Retrieves all Search API pages for many institutions concurrently under a shared rate limit
+## The first page of each institution is requested up front; once it reports total_count, the remaining start offsets are queued
+## Output has the same order and 'institution' tagging as the serial retrieve_all_institutions
+def retrieve_all_institutions_concurrent(url, params_list, headers, page_start, per_page, page_limit=None, max_workers=8, requests_per_second=5, timeout=10, max_retries=3, backoff=1.0, session=None, rate_limiter=None):
+    session = session or create_session(headers, pool_size=max_workers)
+    rate_limiter = rate_limiter or RateLimiter(requests_per_second)
+    pages = {}
+    pending = {}
+
+    def submit(executor, institution_name, start):
+        params = params_list[institution_name].copy()
+        params['start'] = start
+        params['per_page'] = per_page
+        future = executor.submit(fetch_json, session, url, params, timeout=timeout, max_retries=max_retries, backoff=backoff, rate_limiter=rate_limiter)
+        pending[future] = (institution_name, start)
+
+    print(f'Retrieving {len(params_list)} institutions with {max_workers} workers at up to {requests_per_second} requests per second\n')
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for institution_name in params_list:
+            submit(executor, institution_name, page_start)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                institution_name, start = pending.pop(future)
+                data, reason = future.result()
+                if data is None:
+                    print(f'Error retrieving {institution_name} page at start={start}: {reason}\n')
+                    continue
+                pages[(institution_name, start)] = data['data']['items']
+
+                if start == page_start:
+                    total_count = data['data']['total_count']
+                    offsets = list(range(page_start + per_page, total_count, per_page))
+                    if page_limit:
+                        offsets = offsets[:max(page_limit - 1, 0)]
+                    print(f'{institution_name}: {total_count} results, retrieving {len(offsets) + 1} pages\n')
+                    for offset in offsets:
+                        submit(executor, institution_name, offset)
+
+    all_data = []
+    for institution_name in params_list:
+        for (name, start) in sorted(key for key in pages if key[0] == institution_name):
+            for entry in pages[(name, start)]:
+                entry['institution'] = institution_name
+                all_data.append(entry)
+
     return all_data
 
+# Writes failed retrievals from fetch_concurrent to a log CSV
+def write_failed_retrievals(path, failures, today, record_type, mode='w'):
+    write_header = mode == 'w' or not os.path.exists(path)
+    with open(path, mode, newline='', encoding='utf-8') as f:
+        fieldnames = ['Date', 'identifier', 'Error Message', 'Type']
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        if write_header:
+            writer.writeheader()
+        for item in failures:
+            writer.writerow({
+                'Date': today,
+                'identifier': item['identifier'],
+                'Error Message': item['reason'],
+                'Type': record_type
+            })
+
+### Collection tree functions ###
+
+# Walks each institution's collection tree from its root collection (alias), one level of depth at a time
+## Every collection in a level gets its Native API and /contents requests in the same fetch_concurrent batch, so the crawl makes one concurrent round per level
+## Returns (nodes, failures); nodes maps each collection's id to its Native API data, parent, root, depth, child collection ids, and dataset DOIs
+def crawl_collection_trees(url, roots, headers, journal=None, **kwargs):
+    nodes = {}
+    failures = []
+    level = [(root, root, None) for root in roots]
+    depth = 0
+    while level:
+        requests_list = [(kind, identifier) for identifier, _, _ in level for kind in ('native', 'contents')]
+        results, level_failures = fetch_concurrent(
+            requests_list,
+            lambda request: f'{url}{request[1]}' + ('/contents' if request[0] == 'contents' else ''),
+            headers=headers,
+            label=f'collection (depth {depth}) request',
+            journal=journal,
+            **kwargs
+        )
+        failures.extend(level_failures)
+        next_level = []
+        for position, (identifier, root, parent) in enumerate(level):
+            native, contents = results[2 * position], results[2 * position + 1]
+            children = contents.get('data', []) if isinstance(contents, dict) else []
+            child_ids = [child.get('id') for child in children if child.get('type') == 'dataverse']
+            data = native.get('data', {}) if isinstance(native, dict) else {}
+            ## Roots are requested by alias but kept under their id, like every other collection
+            node_id = data.get('id', identifier)
+            if node_id in nodes:
+                continue
+            nodes[node_id] = {
+                'data': data,
+                'parent': parent,
+                'root': root,
+                'depth': depth,
+                'child_ids': child_ids,
+                'dataset_dois': [child['persistentUrl'].replace('https://doi.org/', '') for child in children if child.get('type') == 'dataset' and 'persistentUrl' in child],
+            }
+            next_level.extend((child_id, root, node_id) for child_id in child_ids)
+        ## Collections already in the tree are not requested again, so one reachable twice (like a root inside another root) is only walked once
+        level = [child for child_id, child in {child[0]: child for child in next_level}.items() if child_id not in nodes]
+        depth += 1
+    return nodes, failures
+
+# One row per crawled collection: Native API fields, direct child counts, and subtree totals
+## subtree_collections counts every collection below a collection; subtree_datasets counts its own datasets and every dataset below it
+def collection_tree_frame(nodes):
+    subtree_totals = {}
+
+    def totals(identifier):
+        if identifier not in subtree_totals:
+            node = nodes[identifier]
+            collections, datasets = 0, len(node['dataset_dois'])
+            for child_id in node['child_ids']:
+                if child_id in nodes:
+                    child_collections, child_datasets = totals(child_id)
+                    collections += 1 + child_collections
+                    datasets += child_datasets
+            subtree_totals[identifier] = (collections, datasets)
+        return subtree_totals[identifier]
+
+    rows = []
+    for identifier, node in nodes.items():
+        data = node['data']
+        contacts = data.get('dataverseContacts', [])
+        rows.append({
+            'collection_id': data.get('id', identifier),
+            'collection_contact': [contact.get('contactEmail', None) for contact in contacts if isinstance(contact, dict)],
+            'collection_owner': data.get('ownerId', ''),
+            'collection_creation_date': data.get('creationDate', ''),
+            'collection_identifier': data.get('alias', ''),
+            'collection_root': node['root'],
+            'collection_depth': node['depth'],
+            'num_collections': len(node['child_ids']),
+            'num_datasets': len(node['dataset_dois']),
+            'dataset_dois': '; '.join(node['dataset_dois']),
+            'subtree_collections': totals(identifier)[0],
+            'subtree_datasets': totals(identifier)[1],
+        })
+    return pd.DataFrame(rows, columns=['collection_id', 'collection_contact', 'collection_owner', 'collection_creation_date', 'collection_identifier', 'collection_root', 'collection_depth', 'num_collections', 'num_datasets', 'dataset_dois', 'subtree_collections', 'subtree_datasets'])
+
+### Dataset metrics functions ###
+
+# Make Data Count endpoints on the Dataverse Native API and the metrics columns each one fills
+mdc_endpoints = {
+    'viewsUnique': 'makeDataCount/viewsUnique',
+    'downloadsUnique': 'makeDataCount/downloadsUnique',
+    'downloadsTotal': 'makeDataCount/downloadsTotal',
+    'citations': 'makeDataCount/citations',
+    'viewsTotal': 'makeDataCount/viewsTotal'
+}
+mdc_columns = {'viewsUnique': 'views_unique_dv', 'downloadsUnique': 'downloads_unique_dv', 'downloadsTotal': 'downloads_total_dv', 'viewsTotal': 'views_total_dv'}
+datacite_columns = {'viewCount': 'views_dc', 'downloadCount': 'downloads_dc', 'citationCount': 'citations_dc'}
+
+# Retrieves all Make Data Count metrics for a list of DOIs
+## Every (DOI, endpoint) pair is a separate request, so the five endpoints of one dataset and the requests for the next datasets all share the worker pool and rate limit
+def retrieve_mdc_metrics(url, dois, headers, **kwargs):
+    dois = list(dict.fromkeys(dois))
+    pairs = [(doi, metric_name) for doi in dois for metric_name in mdc_endpoints]
+    results, failures = fetch_concurrent(
+        pairs,
+        lambda pair: f'{url}:persistentId/{mdc_endpoints[pair[1]]}?persistentId=doi:{pair[0]}',
+        headers=headers,
+        label='Make Data Count metric',
+        **kwargs
+    )
+
+    output = {'doi': dois, **{column: [None] * len(dois) for column in mdc_columns.values()}, 'citations_dv': [None] * len(dois), 'citations': [None] * len(dois)}
+    for position, ((doi, metric_name), result) in enumerate(zip(pairs, results)):
+        if result is None:
+            continue
+        row = position // len(mdc_endpoints)
+        data = result.get('data', {})
+        ## Citations are returned as a list of citation texts, all other metrics as counts
+        if metric_name == 'citations':
+            citations_list = data if isinstance(data, list) else []
+            output['citations_dv'][row] = len(citations_list)
+            output['citations'][row] = citations_list
+        else:
+            output[mdc_columns[metric_name]][row] = data.get(metric_name, None)
+
+    failures = [{'identifier': f"{item['identifier'][0]} ({item['identifier'][1]})", 'reason': item['reason']} for item in failures]
+    return pd.DataFrame(output), failures
+
+# Retrieves DataCite views, downloads, and citations for a list of DOIs, batch_size DOIs per request to the /dois list endpoint
+## DOIs not registered with DataCite are left blank; the returned 'doi' column keeps the case of the input DOIs
+def retrieve_datacite_metrics(url, dois, batch_size=100, **kwargs):
+    dois = list(dict.fromkeys(dois))
+    batches = [dois[start:start + batch_size] for start in range(0, len(dois), batch_size)]
+
+    def batch_url(batch):
+        query = ' OR '.join(f'"{doi.lower()}"' for doi in batch)
+        return f"{url}?{urlencode({'query': f'doi:({query})', 'page[size]': len(batch)})}"
+
+    results, failures = fetch_concurrent(batches, batch_url, label='DataCite request', **kwargs)
+
+    found = {}
+    for result in results:
+        for item in (result or {}).get('data', []):
+            attributes = item.get('attributes', {})
+            found[attributes.get('doi', '').lower()] = attributes
+    output = {'doi': dois}
+    for attribute, column in datacite_columns.items():
+        output[column] = [found.get(doi.lower(), {}).get(attribute, None) for doi in dois]
+
+    failures = [{'identifier': doi, 'reason': item['reason']} for item in failures for doi in item['identifier']]
+    return pd.DataFrame(output), failures
+
+# Retrieves Dataverse (Make Data Count) and/or DataCite metrics at the same time and returns a single frame with one row per DOI
+## Counts are nullable integers, so DOIs whose metrics couldn't be retrieved stay blank rather than 0
+def retrieve_dataset_metrics(url_dataverse, url_datacite, dois, headers, dataverse=True, datacite=True, **kwargs):
+    dois = [doi for doi in dict.fromkeys(dois) if isinstance(doi, str) and doi]
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = []
+        if dataverse:
+            futures.append(executor.submit(retrieve_mdc_metrics, url_dataverse, dois, headers, **kwargs))
+        if datacite:
+            futures.append(executor.submit(retrieve_datacite_metrics, url_datacite, dois, **kwargs))
+        results = [future.result() for future in futures]
+
+    metrics_df = pd.DataFrame({'doi': pd.Series(dois, dtype=str)})
+    failures = []
+    for frame, frame_failures in results:
+        metrics_df[frame.columns[1:]] = frame[frame.columns[1:]]
+        failures.extend(frame_failures)
+    for column in [*mdc_columns.values(), 'citations_dv', *datacite_columns.values()]:
+        if column in metrics_df.columns:
+            metrics_df[column] = pd.to_numeric(metrics_df[column], errors='coerce').astype('Int64')
+    return metrics_df, failures
+
+### Native API metadata extraction functions ###
+
+# Each typeName in the citation block is mapped to one handler that returns the columns it fills in
+## Walking a dataset's fields is then a single dictionary lookup per field instead of a chain of if-statements
+## Output is built column by column (a list per column) rather than as a dict per file or author
+
+# Returns the plain value of a primitive field
+def field_value(field):
+    return field.get('value', '')
+# Joins one subfield of a compound field's entries (e.g., every keywordValue of keyword)
+def join_subfield(field, subfield, skip_empty=True):
+    parts = [entry.get(subfield, {}).get('value', '') for entry in field.get('value', [])]
+    return '; '.join(part for part in parts if part or not skip_empty)
+# Counts how many entries of a compound field have a subfield filled in
+def count_subfield(field, subfield):
+    return sum(1 for entry in field.get('value', []) if entry.get(subfield, {}).get('value', ''))
+
+## Dataset-level columns for the file- and author-level outputs (dataverse-file-assessment.ipynb)
+file_assessment_citation_defaults = {
+    'dataset_funders': 'No funding listed',
+    'dataset_contact': 'None listed',
+    'dataset_email': 'None listed',
+    'dataset_depositor': 'None listed',
+}
+file_assessment_citation_handlers = {
+    'grantNumber': lambda field: {'dataset_funders': join_subfield(field, 'grantNumberAgency', skip_empty=False)},
+    'datasetContact': lambda field: {
+        'dataset_contact': join_subfield(field, 'datasetContactName'),
+        'dataset_email': join_subfield(field, 'datasetContactEmail'),
+    },
+    'depositor': lambda field: {'dataset_depositor': field_value(field)},
+}
+
+## Dataset-level columns for metadata completeness (dataverse-metadata-completeness.ipynb)
+completeness_citation_defaults = {
+    'subtitle': None,
+    'alt_title': None,
+    'alt_url': None,
+    'notes': None,
+    'description': None,
+    'description_date': None,
+    'keywords': None,
+    'subject': None,
+    'count_authors': 0,
+    'count_affiliations': 0,
+    'count_identifiers': 0,
+    'count_contributors': 0,
+    'count_contributors_types': 0,
+    'count_contributors_names': 0,
+    'contact_name': None,
+    'contact_email': None,
+    'count_contacts': 0,
+    'count_contact_affiliations': 0,
+    'count_contact_emails': 0,
+    'dataset_depositor': None,
+    'deposit_date': None,
+    'producer': None,
+    'production_date': None,
+    'production_place': None,
+    'distribution_date': None,
+    'period_starts_str': None,
+    'period_ends_str': None,
+    'collection_starts_str': None,
+    'collection_ends_str': None,
+    'related_works': None,
+    'related_dataset': None,
+    'related_material': None,
+    'other_refs': None,
+    'data_type': None,
+    'grant_agencies': None,
+    'data_source': None,
+    'source_origin': None,
+    'source_characteristic': None,
+    'source_access': None,
+}
+completeness_primitive_fields = {
+    'subtitle': 'subtitle',
+    'alternativeTitle': 'alt_title',
+    'alternativeURL': 'alt_url',
+    'notesText': 'notes',
+    'depositor': 'dataset_depositor',
+    'dateOfDeposit': 'deposit_date',
+    'productionDate': 'production_date',
+    'productionPlace': 'production_place',
+    'distributionDate': 'distribution_date',
+    'kindOfData': 'data_type',
+    'relatedMaterial': 'related_material',
+    'relatedDatasets': 'related_dataset',
+    'otherReferences': 'other_refs',
+    'dataSources': 'data_source',
+    'originOfSources': 'source_origin',
+    'characteristicOfSources': 'source_characteristic',
+    'accessToSources': 'source_access',
+}
+# Description and its date come from the last description entry
+def last_description(field):
+    entries = field.get('value', [])
+    if not entries:
+        return {}
+    return {
+        'description': entries[-1].get('dsDescriptionValue', {}).get('value', ''),
+        'description_date': entries[-1].get('dsDescriptionDate', {}).get('value', ''),
+    }
+completeness_citation_handlers = {
+    **{type_name: (lambda column: lambda field: {column: field_value(field)})(column) for type_name, column in completeness_primitive_fields.items()},
+    'grantNumber': lambda field: {'grant_agencies': [entry.get('grantNumberAgency', {}).get('value', '') for entry in field.get('value', [])]},
+    'subject': lambda field: {'subject': field.get('value', [])},
+    'dsDescription': last_description,
+    'keyword': lambda field: {'keywords': join_subfield(field, 'keywordValue')},
+    'datasetContact': lambda field: {
+        'contact_name': join_subfield(field, 'datasetContactName'),
+        'contact_email': join_subfield(field, 'datasetContactEmail'),
+        'count_contacts': len(field.get('value', [])),
+        'count_contact_affiliations': count_subfield(field, 'datasetContactAffiliation'),
+        'count_contact_emails': count_subfield(field, 'datasetContactEmail'),
+    },
+    'author': lambda field: {
+        'count_authors': len(field.get('value', [])),
+        'count_affiliations': count_subfield(field, 'authorAffiliation'),
+        'count_identifiers': count_subfield(field, 'authorIdentifier'),
+    },
+    'contributor': lambda field: {
+        'count_contributors': len(field.get('value', [])),
+        'count_contributors_types': count_subfield(field, 'contributorType'),
+        'count_contributors_names': count_subfield(field, 'contributorName'),
+    },
+    'producer': lambda field: {'producer': join_subfield(field, 'producerName')},
+    'publication': lambda field: {'related_works': join_subfield(field, 'publicationCitation')},
+    'timePeriodCovered': lambda field: {
+        'period_starts_str': join_subfield(field, 'timePeriodCoveredStart'),
+        'period_ends_str': join_subfield(field, 'timePeriodCoveredEnd'),
+    },
+    'dateOfCollection': lambda field: {
+        'collection_starts_str': join_subfield(field, 'dateOfCollectionStart'),
+        'collection_ends_str': join_subfield(field, 'dateOfCollectionEnd'),
+    },
+}
+
+# Applies the handlers to a dataset version's citation block; fields without a handler are skipped
+def extract_citation_fields(version, handlers, defaults):
+    values = defaults.copy()
+    for field in version.get('metadataBlocks', {}).get('citation', {}).get('fields', []):
+        handler = handlers.get(field['typeName'])
+        if handler:
+            values.update(handler(field))
+    return values
+
+file_columns = ['file_id', 'file_name', 'file_mime_type', 'file_tabular', 'file_size', 'file_storage_identifier', 'file_creation_date', 'file_publication_date', 'file_restricted']
+no_file_values = ['NO FILES', 'NO FILES', 'NO FILES', 'NO FILES', 0, 'NO FILES', None, None, 'NO FILES']
+author_columns = ['doi', 'current_status', 'author_name', 'author_affiliation', 'ror_id', 'author_identifier', 'author_identifier_expanded', 'author_identifier_scheme', 'author_count', 'author_position']
+
+# Appends one row per file (or a single 'NO FILES' row) with the dataset-level values repeated in front
+def append_file_rows(columns, dataset_values, files):
+    file_rows = []
+    for file in files:
+        file_info = file.get('dataFile', {})
+        file_rows.append([
+            file_info.get('id', ''),
+            file_info.get('filename', ''),
+            file_info.get('originalFileFormat', file_info.get('contentType', '')),
+            file_info.get('tabularData', ''),
+            file_info.get('filesize', 0),
+            file_info.get('storageIdentifier', ''),
+            file_info.get('creationDate', ''),
+            file_info.get('publicationDate', ''),
+            file.get('restricted', ''),
+        ])
+    if not file_rows:
+        file_rows.append(no_file_values)
+    for column, value in dataset_values.items():
+        columns[column].extend([value] * len(file_rows))
+    for column, values in zip(file_columns, zip(*file_rows)):
+        columns[column].extend(values)
+
+# Appends one row per author; ROR-linked affiliations have the organization name in expandedvalue
+def append_author_rows(columns, doi, status, version):
+    for field in version.get('metadataBlocks', {}).get('citation', {}).get('fields', []):
+        if field['typeName'] != 'author':
+            continue
+        authors = field.get('value', [])
+        for position, author in enumerate(authors, start=1):
+            affiliation = author.get('authorAffiliation', {}).get('value', '')
+            affiliation_expanded = author.get('authorAffiliation', {}).get('expandedvalue', {}).get('termName', '')
+            row = [
+                doi,
+                status,
+                author.get('authorName', {}).get('value', ''),
+                affiliation_expanded if affiliation_expanded else affiliation,
+                affiliation if affiliation_expanded else None,
+                author.get('authorIdentifier', {}).get('value', ''),
+                author.get('authorIdentifier', {}).get('expandedvalue', {}).get('@id', ''),
+                author.get('authorIdentifierScheme', {}).get('value', ''),
+                len(authors),
+                position,
+            ]
+            for column, value in zip(author_columns, row):
+                columns[column].append(value)
+
+# File- and author-level columns from Native API dataset responses (latest version of each dataset)
+def extract_native_files_and_authors_batch(datasets):
+    file_output = {column: [] for column in ['dataset_id', 'doi', *file_assessment_citation_defaults, 'dataset_license', *file_columns]}
+    author_output = {column: [] for column in author_columns}
+    for item in datasets:
+        data = item.get('data', {})
+        latest = data.get('latestVersion', {})
+        doi = latest.get('datasetPersistentId', '')
+        dataset_values = {
+            'dataset_id': data.get('id', ''),
+            'doi': doi,
+            **extract_citation_fields(latest, file_assessment_citation_handlers, file_assessment_citation_defaults),
+            'dataset_license': latest.get('license', {}).get('name', None),
+        }
+        append_file_rows(file_output, dataset_values, latest.get('files', []))
+        append_author_rows(author_output, doi, latest.get('latestVersionPublishingState', ''), latest)
+    return file_output, author_output
+
+# File-level columns from Versions API responses (every published version of each dataset)
+def extract_version_files_batch(version_lists):
+    file_output = {column: [] for column in ['dataset_id', 'version_id', 'doi', 'version', *file_assessment_citation_defaults, 'dataset_license', *file_columns]}
+    for item in version_lists:
+        for version in item.get('data', []):
+            dataset_values = {
+                'dataset_id': version.get('datasetId', ''),
+                'version_id': version.get('id', ''),
+                'doi': version.get('datasetPersistentId', ''),
+                'version': f"{version.get('versionNumber', 0)}.{version.get('versionMinorNumber', 0)}",
+                **extract_citation_fields(version, file_assessment_citation_handlers, file_assessment_citation_defaults),
+                'dataset_license': version.get('license', {}).get('name', None),
+            }
+            append_file_rows(file_output, dataset_values, version.get('files', []))
+    return (file_output,)
+
+# Dataset-level completeness columns from Native API dataset responses
+def extract_native_completeness_batch(datasets):
+    output = {column: [] for column in ['doi', *completeness_citation_defaults, 'current_status']}
+    for item in datasets:
+        latest = item.get('data', {}).get('latestVersion', {})
+        values = {
+            'doi': latest.get('datasetPersistentId', ''),
+            **extract_citation_fields(latest, completeness_citation_handlers, completeness_citation_defaults),
+            'current_status': latest.get('latestVersionPublishingState', ''),
+        }
+        for column, value in values.items():
+            output[column].append(value)
+    return (output,)
+
+# Runs a *_batch extractor over the responses in batches (across a process pool if max_workers is set)
+## Batches are combined in their original order and each output is returned as a dataframe
+def extract_in_batches(extract_batch, items, batch_size=1000, max_workers=None):
+    items = list(items)
+    batches = [items[start:start + batch_size] for start in range(0, len(items), batch_size)] or [[]]
+    if max_workers:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(extract_batch, batches))
+    else:
+        results = [extract_batch(batch) for batch in batches]
+
+    frames = []
+    for position in range(len(results[0])):
+        combined = {column: [] for column in results[0][position]}
+        for result in results:
+            for column, values in result[position].items():
+                combined[column].extend(values)
+        frames.append(pd.DataFrame(combined))
+    return frames
+def extract_native_files_and_authors(datasets, **kwargs):
+    return extract_in_batches(extract_native_files_and_authors_batch, datasets, **kwargs)
+def extract_version_files(version_lists, **kwargs):
+    return extract_in_batches(extract_version_files_batch, version_lists, **kwargs)[0]
+def extract_native_completeness(datasets, **kwargs):
+    return extract_in_batches(extract_native_completeness_batch, datasets, **kwargs)[0]
+
+### Incremental harvest functions ###
+
+# Loads the snapshot saved by the previous incremental run (empty if there isn't one)
+## Maps each DOI to its last update time, version ID(s), and parsed file and author rows
+def load_harvest_snapshot(path):
+    if not os.path.exists(path):
+        print(f'No harvest snapshot found at {path}; all datasets will be retrieved.\n')
+        return {}
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        snapshot = json.load(f)
+    print(f'Loaded harvest snapshot with {len(snapshot)} datasets.\n')
+    return snapshot
+def save_harvest_snapshot(path, snapshot):
+    temp_path = f'{path}.tmp'
+    with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+        json.dump(snapshot, f)
+    os.replace(temp_path, path)
+
+# Summarizes Search API dataset items per DOI (a DOI can be listed twice when a published dataset has a draft)
+def summarize_harvest_listing(items):
+    signatures = {}
+    for item in items:
+        doi = item.get('global_id', '').replace('doi:', '')
+        if not doi:
+            continue
+        signature = signatures.setdefault(doi, {'last_update_time': '', 'version_ids': set()})
+        signature['last_update_time'] = max(signature['last_update_time'], item.get('updatedAt', '') or '')
+        signature['version_ids'].add(str(item.get('versionId', '')))
+    return {
+        doi: {'last_update_time': signature['last_update_time'], 'version_id': '; '.join(sorted(signature['version_ids']))}
+        for doi, signature in signatures.items()
+    }
+
+# Splits DOIs into those that are new or changed since the snapshot and those whose rows can be reused
+def find_changed_datasets(snapshot, signatures, dois):
+    changed = []
+    unchanged = []
+    for doi in dict.fromkeys(dois):
+        previous = snapshot.get(doi)
+        current = signatures.get(doi)
+        if previous and current and previous['last_update_time'] == current['last_update_time'] and previous['version_id'] == current['version_id']:
+            unchanged.append(doi)
+        else:
+            changed.append(doi)
+    return changed, unchanged
+
+# Returns the stored file and author rows for unchanged DOIs
+def reuse_harvest_rows(snapshot, dois):
+    file_rows = [row for doi in dois for row in snapshot[doi]['files']]
+    author_rows = [row for doi in dois for row in snapshot[doi]['authors']]
+    return file_rows, author_rows
+
+# Builds the next snapshot from newly parsed rows; unchanged or failed DOIs keep their old entry and DOIs no longer listed are dropped
+## Parsed rows (lists of dicts or dataframes from extract_native_files_and_authors) carry the 'doi:' prefix from the Native API
+def update_harvest_snapshot(snapshot, signatures, file_entries, author_entries):
+    if isinstance(file_entries, pd.DataFrame):
+        file_entries = file_entries.to_dict('records')
+    if isinstance(author_entries, pd.DataFrame):
+        author_entries = author_entries.to_dict('records')
+    new_files = {}
+    new_authors = {}
+    for row in file_entries:
+        new_files.setdefault(row['doi'].replace('doi:', ''), []).append(row)
+    for row in author_entries:
+        new_authors.setdefault(row['doi'].replace('doi:', ''), []).append(row)
+
+    updated = {}
+    for doi, signature in signatures.items():
+        if doi in new_files:
+            updated[doi] = {**signature, 'files': new_files[doi], 'authors': new_authors.get(doi, [])}
+        elif doi in snapshot:
+            updated[doi] = snapshot[doi]
+    return updated
+
+### Version history functions ###
+
+# Loads the store of parsed file rows for every published version retrieved so far (empty if there isn't one)
+## Maps dataset ID -> 'versionNumber.versionMinorNumber' -> version ID and file rows (as columns); published versions don't change, so they are only parsed once
+def load_version_history(path):
+    if not os.path.exists(path):
+        print(f'No version history found at {path}; all version lists will be retrieved.\n')
+        return {}
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        history = json.load(f)
+    print(f'Loaded version history with {sum(len(versions) for versions in history.values())} versions of {len(history)} datasets.\n')
+    return history
+def save_version_history(path, history):
+    save_harvest_snapshot(path, history)
+
+# Normalizes dataset and version IDs (ints, floats from dataframes, or strings) to the store's string keys
+def id_key(value):
+    try:
+        return str(int(float(value)))
+    except (TypeError, ValueError):
+        return str(value)
+
+# Sorts 'major.minor' version keys numerically (so 1.10 comes after 1.9)
+def version_sort_key(version):
+    major, _, minor = version.partition('.')
+    return int(major), int(minor or 0)
+
+# Finds the datasets whose listed version IDs (from the Search API) include one that isn't in the store yet
+def find_datasets_with_new_versions(history, listed_versions):
+    stored_ids = {dataset_id: {id_key(version['version_id']) for version in versions.values()} for dataset_id, versions in history.items()}
+    return [
+        dataset_id for dataset_id, version_ids in listed_versions.items()
+        if {id_key(version_id) for version_id in version_ids if pd.notna(version_id)} - stored_ids.get(id_key(dataset_id), set())
+    ]
+
+# Parses and stores the versions in /versions responses that are newer than the highest version already stored for each dataset
+## Returns the number of versions parsed; versions without a version number (drafts) aren't stored
+def update_version_history(history, version_lists):
+    parsed = 0
+    for item in version_lists:
+        if not item:
+            continue
+        ## The highest stored version of each dataset before this response was parsed
+        stored_max = {}
+        for version in item.get('data', []):
+            if version.get('versionNumber') is None:
+                continue
+            dataset_id = id_key(version.get('datasetId', ''))
+            versions = history.setdefault(dataset_id, {})
+            if dataset_id not in stored_max:
+                stored_max[dataset_id] = max((version_sort_key(stored) for stored in versions), default=None)
+            key = f"{version['versionNumber']}.{version.get('versionMinorNumber', 0) or 0}"
+            if stored_max[dataset_id] is not None and version_sort_key(key) <= stored_max[dataset_id]:
+                continue
+            (columns,) = extract_version_files_batch([{'data': [version]}])
+            versions[key] = {'version_id': id_key(version.get('id', '')), 'files': columns}
+            parsed += 1
+    return parsed
+
+# Builds the same file-level dataframe as extract_version_files from the stored versions of the given datasets (newest version first)
+def version_history_frame(history, dataset_ids):
+    (combined,) = extract_version_files_batch([])
+    for dataset_id in dict.fromkeys(id_key(dataset_id) for dataset_id in dataset_ids):
+        versions = history.get(dataset_id, {})
+        for key in sorted(versions, key=version_sort_key, reverse=True):
+            for column, values in versions[key]['files'].items():
+                combined[column].extend(values)
+    return pd.DataFrame(combined)
+
+# Lists the files added, removed, or changed (new storage identifier or size under the same name) from each version of a dataset to the next
+## Every file in a dataset's first stored version is listed as added
+def version_file_deltas(history, dataset_ids):
+    output = {column: [] for column in ['dataset_id', 'doi', 'from_version', 'to_version', 'change', 'file_name', 'file_id', 'file_storage_identifier', 'file_size']}
+
+    def file_map(version):
+        files = version['files']
+        return {
+            name: {'file_id': file_id, 'file_storage_identifier': storage_identifier, 'file_size': size}
+            for name, file_id, storage_identifier, size in zip(files['file_name'], files['file_id'], files['file_storage_identifier'], files['file_size'])
+            if storage_identifier != 'NO FILES'
+        }
+
+    for dataset_id in dict.fromkeys(id_key(dataset_id) for dataset_id in dataset_ids):
+        versions = history.get(dataset_id, {})
+        previous_key, previous_files = None, {}
+        for key in sorted(versions, key=version_sort_key):
+            files = file_map(versions[key])
+            doi = versions[key]['files']['doi'][0].replace('doi:', '') if versions[key]['files']['doi'] else ''
+            changes = [('added', name, files[name]) for name in files if name not in previous_files]
+            changes += [('removed', name, previous_files[name]) for name in previous_files if name not in files]
+            changes += [
+                ('changed', name, files[name]) for name in files
+                if name in previous_files and (files[name]['file_storage_identifier'], files[name]['file_size']) != (previous_files[name]['file_storage_identifier'], previous_files[name]['file_size'])
+            ]
+            for change, name, file in changes:
+                for column, value in [('dataset_id', dataset_id), ('doi', doi), ('from_version', previous_key), ('to_version', key), ('change', change), ('file_name', name), *file.items()]:
+                    output[column].append(value)
+            previous_key, previous_files = key, files
+    return pd.DataFrame(output)
+
+### TDL data dump functions ###
+
+# Sheets read from each institution's data dump workbook and the name of the concatenated cache for each
+data_dump_sheets = {'datasets': 'datasets-concatenated', 'dataverses': 'collections-concatenated'}
+# Columns kept from the data dump for merging
+data_dump_dataset_columns = ['institution', 'persistentUrl', 'identifier', 'publicationDate', 'versionState', 'depositor', 'createTime', 'contentSize (MB)', 'totalFiles']
+data_dump_collection_columns = ['name', 'alias', 'id', 'dataverseType', 'contactIdentifier', 'contentSize (MB)', 'released', 'creationDate', 'institution']
+
+# Finds the most recent 'dataverse-reports-YYYYMMDD' folder and its date
+def find_latest_folder(base_path=".", pattern="dataverse-reports-"):
+    matching_folders = []
+
+    for folder in os.listdir(base_path):
+        folder_path = os.path.join(base_path, folder)
+
+        if os.path.isdir(folder_path) and folder.startswith(pattern):
+            # Assumes this format: dataverse-reports-YYYYMMDD
+            date_match = re.search(r'(\d{8})$', folder)
+
+            if date_match:
+                date_str = date_match.group(1)
+                try:
+                    folder_date = datetime.strptime(date_str, "%Y%m%d")
+                    matching_folders.append((folder_path, folder_date, folder))
+                except ValueError:
+                    continue
+
+    if not matching_folders:
+        return None, None
+
+    # Sort by date and return the most recent
+    latest = sorted(matching_folders, key=lambda x: x[1], reverse=True)[0]
+    return latest[0], latest[1]
+
+# Reads every data dump sheet from one workbook in a single open, tagging rows with the institution from the filename
+## Returns the frames by sheet name and any errors as messages (a missing sheet doesn't stop the other sheet from loading)
+def read_data_dump_workbook(file_path):
+    file = os.path.basename(file_path)
+    institution = file.split("-")[0]
+    frames = {}
+    errors = []
+    try:
+        with pd.ExcelFile(file_path) as workbook:
+            for sheet in data_dump_sheets:
+                try:
+                    df = workbook.parse(sheet_name=sheet)
+                    df["institution"] = institution
+                    frames[sheet] = df
+                except Exception as e:
+                    errors.append(f'Error reading {file} ({sheet}): {e}')
+    except Exception as e:
+        errors.append(f'Error reading {file}: {e}')
+    return frames, errors
+
+# Identifies the current set of workbooks by name, size, and modification time
+def data_dump_signature(excel_paths):
+    stats = [(os.path.basename(path), os.path.getsize(path), os.path.getmtime(path)) for path in sorted(excel_paths)]
+    return hashlib.sha256(json.dumps(stats).encode('utf-8')).hexdigest()
+
+# Loads the cached concatenated sheets if they were built from the current workbooks (Parquet first, then CSV)
+def read_data_dump_cache(dv_report, signature):
+    manifest_path = os.path.join(dv_report, 'data-dump-cache.json')
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        if json.load(f).get('signature') != signature:
+            return None
+
+    combined = {}
+    for sheet, name in data_dump_sheets.items():
+        parquet_path = os.path.join(dv_report, f'{name}.parquet')
+        csv_path = os.path.join(dv_report, f'{name}.csv')
+        try:
+            combined[sheet] = pd.read_parquet(parquet_path)
+        except (ImportError, FileNotFoundError):
+            if not os.path.exists(csv_path):
+                return None
+            combined[sheet] = pd.read_csv(csv_path)
+    return combined
+
+# Writes the concatenated sheets as CSV and Parquet, then records which workbooks they came from
+def write_data_dump_cache(dv_report, signature, combined):
+    for sheet, df in combined.items():
+        path = os.path.join(dv_report, f'{data_dump_sheets[sheet]}.csv')
+        df.to_csv(path, index=False, encoding="utf-8-sig")
+        try:
+            stringify_mixed_columns(df).to_parquet(f'{os.path.splitext(path)[0]}.parquet', index=False)
+        except ImportError:
+            pass
+        except Exception as e:
+            print(f'Could not cache {sheet} as Parquet: {e}')
+        print(f'Saved: {path} ({len(df)} total rows)')
+    with open(os.path.join(dv_report, 'data-dump-cache.json'), 'w', encoding='utf-8') as f:
+        json.dump({'signature': signature, 'created': datetime.now().isoformat()}, f)
+
+# Loads the 'datasets' and 'dataverses' sheets of all workbooks in a data dump folder as two concatenated dataframes
+## Workbooks are parsed across a process pool and the result is cached in the folder until a workbook is added, removed, or modified
+def load_data_dump(dv_report, max_workers=None):
+    excel_paths = sorted(os.path.join(dv_report, f) for f in os.listdir(dv_report) if f.endswith(".xlsx"))
+    signature = data_dump_signature(excel_paths)
+
+    combined = read_data_dump_cache(dv_report, signature)
+    if combined is not None:
+        print('Loaded existing concatenated datasets and collections files.\n')
+        return combined['datasets'], combined['dataverses']
+
+    if len(excel_paths) > 1 and max_workers != 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(read_data_dump_workbook, excel_paths))
+    else:
+        results = [read_data_dump_workbook(path) for path in excel_paths]
+
+    sheet_lists = {sheet: [] for sheet in data_dump_sheets}
+    for path, (frames, errors) in zip(excel_paths, results):
+        for error in errors:
+            print(error)
+        for sheet, df in frames.items():
+            sheet_lists[sheet].append(df)
+        print(f'{os.path.basename(path)} - ' + ', '.join(f'{len(df)} {sheet} rows' for sheet, df in frames.items()))
+
+    if not all(sheet_lists.values()):
+        print('No data dump workbooks could be read.\n')
+        return None, None
+    combined = {sheet: pd.concat(frames, ignore_index=True) for sheet, frames in sheet_lists.items()}
+    write_data_dump_cache(dv_report, signature, combined)
+    print()
+    return combined['datasets'], combined['dataverses']
+
+# Prunes the data dump for merging, indexed by persistentUrl (datasets) and alias (collections)
+## The key columns are kept as well, so the dump can be joined onto other dataframes by index
+def index_data_dump(datasets_df, collections_df):
+    datasets_pruned = datasets_df[data_dump_dataset_columns].rename(columns={'institution': 'host_collection'})
+    ## Label deaccessioned datasets
+    datasets_pruned['versionState'] = datasets_pruned['versionState'].fillna('DEACCESSIONED')
+    datasets_pruned = datasets_pruned.set_index('persistentUrl', drop=False)
+
+    collections_pruned = collections_df[data_dump_collection_columns].set_index('alias', drop=False)
+    return datasets_pruned, collections_pruned
+
+### Affiliation resolution functions ###
+
+# Compiles institution name variations into one regular expression, so each affiliation is scanned once instead of once per variation
+## Longer variations come first so that one that contains another still matches in full
+affiliation_patterns = {}
+def affiliation_pattern(variations):
+    key = tuple(variations)
+    if key not in affiliation_patterns:
+        alternatives = sorted(set(key), key=len, reverse=True)
+        affiliation_patterns[key] = re.compile('|'.join(re.escape(variation) for variation in alternatives) if alternatives else r'(?!)')
+    return affiliation_patterns[key]
+
+# Normalizes affiliation or funder strings so that case, punctuation, accents and spacing variants share one index key
+def normalize_affiliations(values):
+    values = pd.Series(values, dtype=object)
+    normalized = (
+        values.where(values.map(lambda value: isinstance(value, str)))
+        .str.normalize('NFKD').str.replace(r'[\u0300-\u036f]', '', regex=True)
+        .str.lower()
+        .str.replace(r'[^\w\s]', ' ', regex=True)
+        .str.replace(r'\s+', ' ', regex=True)
+        .str.strip()
+    )
+    return normalized.where(normalized != '')
+
+# Persistent (SQLite) index from normalized affiliation and funder strings to ROR IDs
+## kind separates the 'affiliation' and 'funder' maps; strings that could not be resolved are kept with an empty ror so they aren't looked up again
+## Entries edited by hand (curated=1) are never overwritten by automatic resolution
+class RORIndex:
+    def __init__(self, path='ror-index.sqlite'):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS ror_index ('
+            'kind TEXT, normalized TEXT, original TEXT, ror TEXT, official_name TEXT, curated INTEGER, resolved_at REAL, '
+            'PRIMARY KEY (kind, normalized))'
+        )
+        self.connection.commit()
+
+    # Values with no entry yet, one per normalized string (the first spelling seen)
+    def unseen(self, kind, values):
+        values = pd.Series(values, dtype=object)
+        keys = normalize_affiliations(values)
+        firsts = ~keys.duplicated() & keys.notna()
+        with self.lock:
+            known = {row[0] for row in self.connection.execute('SELECT normalized FROM ror_index WHERE kind = ?', (kind,))}
+        return [value for key, value in zip(keys[firsts], values[firsts]) if key not in known]
+
+    # Adds or replaces entries; records is a frame (or list of dicts) with original, ror and official_name
+    def update(self, kind, records, curated=False):
+        records = pd.DataFrame(records, columns=['original', 'ror', 'official_name'])
+        records['normalized'] = normalize_affiliations(records['original']).to_numpy()
+        records = records.dropna(subset=['normalized']).drop_duplicates(subset=['normalized'], keep='first')
+        records = records.astype(object).where(records.notna(), None)
+        now = time.time()
+        rows = [(kind, row.normalized, row.original, row.ror, row.official_name, int(curated), now) for row in records.itertuples(index=False)]
+        with self.lock:
+            if curated:
+                self.connection.executemany('INSERT OR REPLACE INTO ror_index VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+            else:
+                self.connection.executemany(
+                    'INSERT INTO ror_index VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (kind, normalized) DO UPDATE SET '
+                    'original = excluded.original, ror = excluded.ror, official_name = excluded.official_name, resolved_at = excluded.resolved_at '
+                    'WHERE curated = 0', rows
+                )
+            self.connection.commit()
+        return len(rows)
+
+    # Looks up values (any order, duplicates and blanks allowed) and returns ror and official_name on the same index
+    def lookup(self, kind, values):
+        values = pd.Series(values, dtype=object)
+        normalized = normalize_affiliations(values)
+        with self.lock:
+            entries = pd.read_sql_query('SELECT normalized, ror, official_name FROM ror_index WHERE kind = ?', self.connection, params=(kind,))
+        entries = entries.set_index('normalized').astype(object)
+        entries = entries.where(entries.notna(), None)
+        positions = entries.index.get_indexer(normalized)
+        found = positions >= 0
+        result = pd.DataFrame({'ror': None, 'official_name': None}, index=values.index, dtype=object)
+        for column in ('ror', 'official_name'):
+            result.loc[found, column] = entries[column].to_numpy(dtype=object)[positions[found]]
+        return result
+
+    # Seeds the index from a hand-curated map CSV (e.g. affiliation-map-primary.csv with affiliation, ror, official_name columns)
+    def import_csv(self, kind, path, column):
+        mapped = pd.read_csv(path, dtype=str, encoding='utf-8-sig')
+        mapped = mapped.dropna(subset=['ror']).rename(columns={column: 'original'})
+        return self.update(kind, mapped, curated=True)
+
+    def to_frame(self, kind):
+        with self.lock:
+            return pd.read_sql_query('SELECT original, ror, official_name, curated FROM ror_index WHERE kind = ? ORDER BY normalized', self.connection, params=(kind,))
+
+# Chooses the organization the ROR affiliation API is confident about (its 'chosen' match), if any
+def chosen_ror_match(data):
+    for item in (data or {}).get('items', []):
+        if item.get('chosen'):
+            organization = item.get('organization', {})
+            names = organization.get('names', [])
+            official_name = next((name.get('value') for name in names if 'ror_display' in name.get('types', [])), None)
+            return organization.get('id'), official_name
+    return None, None
+
+# Adds entries for the values that aren't in the index yet, matching them with the ROR affiliation API concurrently; returns the number of new entries
+## Strings that fail to retrieve are left out (so they are retried next run); strings with no confident match are stored without a ROR ID
+def update_ror_index(index, kind, values, url='https://api.ror.org/v2/organizations', **kwargs):
+    unseen = index.unseen(kind, values)
+    if not unseen:
+        print(f'All {kind} strings are already in the ROR index\n')
+        return 0
+    results, failures = fetch_concurrent(unseen, lambda value: f'{url}?{urlencode({"affiliation": value})}', label=f'{kind} lookup', **kwargs)
+    records = [(value, *chosen_ror_match(data)) for value, data in zip(unseen, results) if data is not None]
+    added = index.update(kind, records)
+    print(f'Added {added} {kind} strings to the ROR index ({sum(ror is not None for _, ror, _ in records)} matched, {len(failures)} failed to retrieve)\n')
+    return added
+
 ### Metadata cleaning / assessment functions ###
 
 # Determines which author (first vs. last or both) is affiliated
@@ -337,8 +1838,9 @@ def determine_affiliation(row, ut_variations):
     if row['first_author'] == row['last_author']:
         return 'single author'
 
-    first_affiliated = any(variation in (row['first_affiliation'] or '') for variation in ut_variations)
-    last_affiliated = any(variation in (row['last_affiliation'] or '') for variation in ut_variations)
+    pattern = affiliation_pattern(ut_variations)
+    first_affiliated = bool(pattern.search(row['first_affiliation'] or ''))
+    last_affiliated = bool(pattern.search(row['last_affiliation'] or ''))
 
     if first_affiliated and last_affiliated:
         return 'both lead and senior'
@@ -349,14 +1851,29 @@ def determine_affiliation(row, ut_variations):
     else:
         return 'neither lead nor senior'
 
+# Same labels as determine_affiliation for a whole frame of first/last authors and affiliations, matching each affiliation column once
+def determine_affiliations(df, ut_variations):
+    pattern = affiliation_pattern(ut_variations)
+    first_affiliated = df['first_affiliation'].str.contains(pattern, na=False).to_numpy(dtype=bool)
+    last_affiliated = df['last_affiliation'].str.contains(pattern, na=False).to_numpy(dtype=bool)
+    single_author = df['first_author'].eq(df['last_author']).to_numpy(dtype=bool)
+    labels = np.select(
+        [single_author, first_affiliated & last_affiliated, first_affiliated, last_affiliated],
+        ['single author', 'both lead and senior', 'only lead', 'only senior'],
+        default='neither lead nor senior'
+    )
+    return pd.Series(labels, index=df.index, dtype=object)
+
 # Standard function to look for file with specified pattern in name in specified directory
 def load_most_recent_file(outputs_dir, pattern):
     files = os.listdir(outputs_dir)
     files.sort(reverse=True)
+    # A Parquet copy written by write_output has the same name as the CSV and is preferred
+    parquet_pattern = f'{pattern[:-4]}.parquet' if pattern.endswith('.csv') else None
 
     latest_file = None
     for file in files:
-        if pattern in file:
+        if pattern in file or (parquet_pattern and parquet_pattern in file):
             latest_file = file
             break
 
@@ -365,7 +1882,15 @@ def load_most_recent_file(outputs_dir, pattern):
         return None
     else:
         file_path = os.path.join(outputs_dir, latest_file)
-        df = pd.read_csv(file_path)
+        if latest_file.endswith('.parquet'):
+            try:
+                df = read_output_parquet(file_path)
+            except ImportError:
+                print('pyarrow is not installed; loading the CSV version instead.')
+                latest_file = f'{latest_file[:-8]}.csv'
+                df = pd.read_csv(os.path.join(outputs_dir, latest_file))
+        else:
+            df = pd.read_csv(file_path)
         print(f"The most recent file '{latest_file}' has been loaded successfully.")
         return df
 
@@ -382,9 +1907,101 @@ def find_mapped_drive(directory):
 
 # Checks if hypothetical DOI exists (for PLOS SI workflow)
 def check_link(doi):
-    url = f'https://doi.org/{doi}'
-    response = requests.head(url, allow_redirects=True)
-    return response.status_code == 200
+    return check_links([doi]).get(doi)
+
+# Shared DOICheckCache in cache/ next to utils.py, with the lifetimes from VARIABLES.DOI_CHECKS in config.json (built on first use)
+doi_check_cache = None
+def default_doi_check_cache():
+    global doi_check_cache
+    if doi_check_cache is None:
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        ttl_hours = None
+        try:
+            with open(os.path.join(script_dir, 'config.json'), 'r') as file:
+                ttl_hours = json.load(file)['VARIABLES']['DOI_CHECKS']['ttl_hours']
+        except (OSError, KeyError, json.JSONDecodeError):
+            pass
+        doi_check_cache = DOICheckCache(os.path.join(script_dir, 'cache'), ttl_hours)
+    return doi_check_cache
+
+# Results of DOI existence checks, kept between runs in an SQLite file
+## Registered DOIs stay trusted for longer than missing ones (ttl_hours 'exists' and 'missing'), since a missing DOI may be registered later
+class DOICheckCache:
+    def __init__(self, directory='cache', ttl_hours=None):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, 'doi-checks.sqlite')
+        self.ttl_hours = ttl_hours or {'exists': 720, 'missing': 24}
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS doi_checks (doi TEXT PRIMARY KEY, found INTEGER, checked_at REAL)')
+        self.connection.commit()
+
+    # Returns {doi: True/False} for the DOIs with a result that hasn't expired
+    def lookup(self, dois):
+        now = time.time()
+        known = {}
+        with self.lock:
+            for start in range(0, len(dois), 500):
+                batch = dois[start:start + 500]
+                rows = self.connection.execute(f'SELECT doi, found, checked_at FROM doi_checks WHERE doi IN ({",".join("?" * len(batch))})', batch)
+                for doi, found, checked_at in rows:
+                    if now - checked_at < self.ttl_hours['exists' if found else 'missing'] * 3600:
+                        known[doi] = bool(found)
+        return known
+
+    def store(self, results):
+        now = time.time()
+        with self.lock:
+            self.connection.executemany('INSERT OR REPLACE INTO doi_checks VALUES (?, ?, ?)', [(doi, int(found), now) for doi, found in results.items()])
+            self.connection.commit()
+
+# Checks whether DOIs are registered, without following redirects to the publisher
+## doi.org answers a registered DOI with a redirect and an unknown one with 404, so only the first response is needed
+## Returns {doi: True/False}, or None where the check failed (timeouts, 429s and 5xx errors are retried first, and failures are not cached)
+## Known results come from cache (the shared DOICheckCache unless another is given; cache=False checks every DOI); requests share one rate limit per host
+def check_links(dois, max_workers=8, requests_per_second=5, timeout=10, max_retries=2, backoff=1.0, cache=None, resolver='https://doi.org'):
+    dois = list(dict.fromkeys(dois))
+    if cache is None:
+        cache = default_doi_check_cache()
+    results = cache.lookup(dois) if cache else {}
+    remaining = [doi for doi in dois if doi not in results]
+    if cache and len(dois) > 1:
+        print(f'{len(results)} of {len(dois)} DOIs answered from the DOI check cache\n')
+    session = create_session(pool_size=max_workers)
+    host_limiters = {}
+    limiter_lock = threading.Lock()
+
+    def check(doi):
+        url = f'{resolver}/{quote(doi, safe="/")}'
+        with limiter_lock:
+            rate_limiter = host_limiters.setdefault(urlparse(url).netloc, RateLimiter(requests_per_second))
+        for attempt in range(max_retries + 1):
+            if attempt:
+                record_retry()
+                time.sleep(backoff * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5))
+            rate_limiter.acquire()
+            started = time.perf_counter()
+            try:
+                response = session.head(url, allow_redirects=False, timeout=timeout)
+            except requests.exceptions.RequestException:
+                record_request(seconds=time.perf_counter() - started, outcome='error')
+                continue
+            record_request(seconds=time.perf_counter() - started, status=response.status_code)
+            if response.status_code == 404:
+                return False
+            if 200 <= response.status_code < 400:
+                return True
+            if response.status_code not in retry_status_codes:
+                return None
+        return None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        checked = dict(zip(remaining, executor.map(check, remaining)))
+    if cache:
+        cache.store({doi: found for doi, found in checked.items() if found is not None})
+    results.update(checked)
+    return {doi: results[doi] for doi in dois}
 
 # Validate formatting of ORCID and ROR in metadata
 def is_valid_orcid(orcid):
@@ -417,6 +2034,59 @@ def is_in_break(date, ranges):
             return True
     return False
 
+## Calendar features for a whole date column at once (the helpers above are for single values)
+
+day_names = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+day_name_dtype = pd.CategoricalDtype(day_names, ordered=True)
+
+# U.S. federal holidays in the given years, as a DatetimeIndex (built once per set of years)
+holiday_indexes = {}
+def us_holiday_index(years):
+    years = tuple(sorted(set(years)))
+    if years not in holiday_indexes:
+        holiday_indexes[years] = pd.DatetimeIndex(sorted(holidays.US(years=years).keys())).as_unit('ns')
+    return holiday_indexes[years]
+
+# Turns (start, end) date pairs into a non-overlapping IntervalIndex closed on both ends
+## Overlapping or touching ranges are merged so that each date falls in at most one interval
+def break_interval_index(ranges):
+    merged = []
+    for start, end in sorted((pd.Timestamp(start), pd.Timestamp(end)) for start, end in ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return pd.IntervalIndex.from_arrays(
+        pd.DatetimeIndex([start for start, _ in merged]).as_unit('ns'),
+        pd.DatetimeIndex([end for _, end in merged]).as_unit('ns'),
+        closed='both'
+    )
+
+# Adds calendar flags for a column of dates (ISO strings or datetimes), parsing the column once
+## Returns a frame on the same index with date, day_of_week (ordered Monday-Sunday), is_weekend, is_us_federal_holiday and is_in_break
+## Unparseable dates get NaT/NaN and False flags; break_ranges are (start, end) pairs, both ends included as in is_in_break
+def calendar_features(dates, break_ranges=(), date_format='ISO8601'):
+    ## UTC offsets are dropped (not converted) so each date keeps its local calendar day
+    dates = parse_local_datetimes(dates, date_format).dt.as_unit('ns')
+    valid = dates.notna().to_numpy()
+    weekday = dates.dt.weekday.fillna(-1).to_numpy(dtype=np.int8)
+    days = dates.dt.normalize()
+
+    features = pd.DataFrame(index=dates.index)
+    features['date'] = dates
+    features['day_of_week'] = pd.Categorical.from_codes(weekday, dtype=day_name_dtype)
+    features['is_weekend'] = weekday >= 5
+    features['is_us_federal_holiday'] = False
+    if valid.any():
+        years = dates.dt.year[valid]
+        holiday_index = us_holiday_index(range(int(years.min()), int(years.max()) + 1))
+        features['is_us_federal_holiday'] = days.isin(holiday_index).to_numpy() & valid
+    features['is_in_break'] = False
+    break_ranges = list(break_ranges)
+    if break_ranges and valid.any():
+        features['is_in_break'] = break_interval_index(break_ranges).get_indexer(dates) >= 0
+    return features
+
 # Return only the highest value for the version number in a Dataverse retrieval
 def extract_max_version(val):
     if isinstance(val, str):
@@ -427,6 +2097,18 @@ def extract_max_version(val):
             return val  # In case of unexpected format
     return val
 
+# Same as applying extract_max_version to every value, but each distinct version string is only parsed once
+def extract_max_versions(values):
+    values = pd.Series(values).astype(object)
+    codes, uniques = pd.factorize(values)
+    if len(uniques) == 0:
+        return values.infer_objects()
+    ## Strings never share a code with numbers, so only positions coded to a string are replaced
+    parsed = np.array([extract_max_version(value) for value in uniques], dtype=object)
+    is_string = np.array([isinstance(value, str) for value in uniques] + [False])
+    replace = is_string[codes]
+    return values.where(~replace, parsed[np.where(replace, codes, 0)]).infer_objects()
+
 # Counts descriptive words in text field
 def count_words(text, nondescriptive_words):
     if not isinstance(text, str) or text.strip() == '':
@@ -455,6 +2137,8 @@ def analyze_keywords(keywords_list, nondescriptive_words):
     }
 
 ## Adjust for specific phrases in descriptive word counting
+supplemental_material_phrases = ['supplemental material','supplementary material','supplementary materials','supplemental materials','supporting materials']
+supplemental_material_pattern = re.compile('|'.join(re.escape(phrase) for phrase in supplemental_material_phrases))
 def adjust_descriptive_count_title(row):
     title = row.get('title_reformatted')
     desc_count = row.get('descriptive_word_count_title', 0)
@@ -467,9 +2151,7 @@ def adjust_descriptive_count_title(row):
         except (ValueError, TypeError):
             desc_count = 0
 
-    keywords = ['supplemental material','supplementary material','supplementary materials','supplemental materials','supporting materials']
-
-    if any(keyword in title.lower() for keyword in keywords):
+    if supplemental_material_pattern.search(title.lower()):
         return max(0, desc_count - 1)
     return desc_count
 def adjust_descriptive_count_description(row):
@@ -484,12 +2166,42 @@ def adjust_descriptive_count_description(row):
         except (ValueError, TypeError):
             desc_count = 0
 
-    keywords = ['supplemental material','supplementary material','supplementary materials','supplemental materials','supporting materials']
-
-    if any(keyword in title.lower() for keyword in keywords):
+    if supplemental_material_pattern.search(title.lower()):
         return max(0, desc_count - 1)
     return desc_count
 
+# Counts total and descriptive words for a whole Series of text at once (same counts as count_words)
+## Text is lowercased column-wise first, so each word is only a frozenset lookup
+def count_words_batch(texts, nondescriptive_words):
+    nondescriptive_words = frozenset(nondescriptive_words)
+    texts = pd.Series(texts, dtype=object)
+    lowered = texts.where(texts.map(lambda text: isinstance(text, str)), '').str.lower()
+    is_nondescriptive = nondescriptive_words.__contains__
+    counts = np.array([(len(words), len(words) - sum(map(is_nondescriptive, words))) for words in map(str.split, lowered)], dtype=int).reshape(-1, 2)
+    total, descriptive = counts[:, 0], counts[:, 1]
+    return total, descriptive, lowered
+
+# Scores titles, descriptions, and keyword lists in one pass and returns every count column
+## Equivalent to applying count_words, analyze_keywords, and adjust_descriptive_count_* row by row
+def score_metadata_quality(titles, descriptions, keywords, nondescriptive_words):
+    nondescriptive_words = frozenset(nondescriptive_words)
+    scores = pd.DataFrame(index=pd.Series(titles).index)
+
+    for field, texts in [('title', titles), ('description', descriptions)]:
+        total, descriptive, lowered = count_words_batch(texts, nondescriptive_words)
+        # Supplemental material phrases don't count as a descriptive word
+        has_phrase = lowered.str.contains(supplemental_material_pattern).to_numpy(dtype=bool)
+        scores[f'total_word_count_{field}'] = total
+        scores[f'descriptive_word_count_{field}'] = np.maximum(descriptive - has_phrase, 0)
+
+    keyword_lists = [keywords_list if isinstance(keywords_list, (list, np.ndarray)) else [] for keywords_list in keywords]
+    total_keywords = [len(keywords_list) for keywords_list in keyword_lists]
+    # Missing (non-text) keyword entries are counted in the total but are never malformatted or descriptive
+    keyword_lists = [[kw for kw in keywords_list if isinstance(kw, str)] for keywords_list in keyword_lists]
+    scores['malformatted_keywords'] = [any(',' in kw or ';' in kw for kw in keywords_list) for keywords_list in keyword_lists]
+    scores['total_keywords'] = total_keywords
+    scores['descriptive_keywords'] = [sum(1 for kw in keywords_list if kw.strip() and kw.lower() not in nondescriptive_words) for keywords_list in keyword_lists]
+    return scores
 
 def safe_split(val):
     # If it's already a list/array, return as is
@@ -514,32 +2226,136 @@ def standardize_registrant_name(row):
         name = str(row['name']).strip() if pd.notna(row['name']) else ''
         return name.title() if name else pd.NA
     
+# Size bins (file or dataset level) for TDR datasets, as an ordered categorical
+## Each bin covers (previous edge, edge]; sizes of 1 byte or less (and missing sizes) are 'Empty', and anything over the last edge is '>50 GB'
+size_bin_edges = np.array([1, 1024, 1024 ** 2, 100 * 1024 ** 2, 1024 ** 3, 10 * 1024 ** 3, 15 * 1024 ** 3, 20 * 1024 ** 3, 25 * 1024 ** 3, 30 * 1024 ** 3, 40 * 1024 ** 3, 50 * 1024 ** 3], dtype=float)
+size_bin_labels = ['Empty', '0-10 kB', '10 kB-1 MB', '1-100 MB', '100 MB-1 GB', '1-10 GB', '10-15 GB', '15-20 GB', '20-25 GB', '25-30 GB', '30-40 GB', '40-50 GB', '>50 GB'] #'0-10 kB' technically starts above 1 byte
+size_bin_dtype = pd.CategoricalDtype(size_bin_labels, ordered=True)
+
+# Bins sizes with a single searchsorted over the bin edges
+def size_bins(sizes):
+    sizes = pd.to_numeric(pd.Series(sizes), errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    codes = np.searchsorted(size_bin_edges, sizes, side='left')
+    codes[np.isnan(sizes)] = 0
+    return pd.Categorical.from_codes(codes, dtype=size_bin_dtype)
+
 # Function to assign size bins (file or dataset level) for TDR datasets
+## Adds the column to df itself (no copy) and returns df
 def assign_size_bins(df, column='file_size', new_column='file_size_bin'):
-    df=df.copy()
-    bins = [
-        (1, 1 * 1024, '0-10 kB'), #technically not 0, 'Empty' is separate
-        (1 * 1024, 1 * 1024 * 1024, '10 kB-1 MB'),
-        (1 * 1024 * 1024, 100 * 1024 * 1024, '1-100 MB'),
-        (100 * 1024 * 1024, 1 * 1024 * 1024 * 1024, '100 MB-1 GB'),
-        (1 * 1024 * 1024 * 1024, 10 * 1024 * 1024 * 1024, '1-10 GB'),
-        (10 * 1024 * 1024 * 1024, 15 * 1024 * 1024 * 1024, '10-15 GB'),
-        (15 * 1024 * 1024 * 1024, 20 * 1024 * 1024 * 1024, '15-20 GB'),
-        (20 * 1024 * 1024 * 1024, 25 * 1024 * 1024 * 1024, '20-25 GB'),
-        (25 * 1024 * 1024 * 1024, 30 * 1024 * 1024 * 1024, '25-30 GB'),
-        (30 * 1024 * 1024 * 1024, 40 * 1024 * 1024 * 1024, '30-40 GB'),
-        (40 * 1024 * 1024 * 1024, 50 * 1024 * 1024 * 1024, '40-50 GB'),
-    ]
-
-    #default set to empty
-    df[new_column] = 'Empty'
-    for lower, upper, label in bins:
-        df.loc[(df[column] > lower) & (df[column] <= upper), new_column] = label
-    #maximum bin
-    df.loc[df[column] > 50 * 1024 * 1024 * 1024, new_column] = '>50 GB'
-
+    df[new_column] = size_bins(df[column])
     return df
 
+## File format classification
+
+# Documentation flags and the (case-insensitive) patterns searched for in file names
+documentation_patterns = {'file_readme': 'readme|read_me', 'file_codebook': 'codebook', 'file_data_dict': 'dictionary'}
+# Category flags and the config.json maps whose keys belong to each category
+mime_type_categories = {'file_software': 'SOFTWARE_FORMATS', 'file_compressed': 'COMPRESSED_FORMATS', 'file_microsoft_office': 'MICROSOFT_FORMATS'}
+
+# Builds the classification of each distinct mime type: its friendly format (FORMAT_MAP) and category flags
+## A mime type is in a category if any of its ';'-separated parts is; 'no match found' (from the data dump) means no files
+def mime_type_index(mime_types, config):
+    format_map = config['FORMAT_MAP']
+    category_formats = {flag: set(config[key].keys()) for flag, key in mime_type_categories.items()}
+    rows = []
+    for mime_type in mime_types:
+        row = {'friendly_format_manual': format_map.get(mime_type.strip(), mime_type.strip()) if mime_type != 'no match found' else 'no files'}
+        parts = [part.strip() for part in mime_type.split(';')]
+        for flag, formats in category_formats.items():
+            row[flag] = any(part in formats for part in parts)
+        rows.append(row)
+    return pd.DataFrame(rows, index=pd.Index(mime_types, dtype=object), columns=['friendly_format_manual', *mime_type_categories])
+
+# Classifies every file's mime type, looking up each distinct value once
+## Missing (or non-text) mime types are 'no files' and in no category
+def classify_mime_types(mime_types, config):
+    codes, uniques = pd.factorize(mime_types)
+    is_text = np.array([isinstance(value, str) for value in uniques] + [False])
+    index = mime_type_index([value for value in uniques if isinstance(value, str)], config)
+    ## Positions in the index for each distinct value; the extra last row is the 'no files' classification
+    positions = np.cumsum(is_text) - 1
+    positions[~is_text] = len(index)
+    classified = pd.concat([index, pd.DataFrame([{'friendly_format_manual': 'no files', **{flag: False for flag in mime_type_categories}}])], ignore_index=True)
+    classified = classified.iloc[positions[codes]]
+    classified.index = mime_types.index
+    return classified
+
+# Flags file names that look like a readme, codebook, or data dictionary
+## One combined pattern finds the few names that match any of them; only those are checked pattern by pattern
+def flag_documentation_files(file_names):
+    combined = file_names.str.contains('|'.join(documentation_patterns.values()), case=False)
+    candidates = combined.fillna(False).astype(bool)
+    flags = pd.DataFrame(index=file_names.index)
+    for flag, pattern in documentation_patterns.items():
+        flags[flag] = combined.copy()
+        flags.loc[candidates, flag] = file_names[candidates].str.contains(pattern, case=False)
+    return flags
+
+## File-to-dataset aggregation
+
+# Codes each value by its text, the way str() would show it, so values with the same text share a code
+## Returns (codes, labels); each distinct value is converted to text once
+def text_codes(column):
+    try:
+        codes, uniques = pd.factorize(column)
+    except TypeError:
+        ## Unhashable values (e.g. lists of subjects from the Search API) are compared by their text
+        unhashable = column.map(lambda value: isinstance(value, (list, dict, set))).to_numpy(dtype=bool)
+        column = column.astype(object).copy()
+        column[unhashable] = column[unhashable].map(str)
+        codes, uniques = pd.factorize(column)
+    if column.dtype == object and len({type(value) for value in uniques}) > 1:
+        ## Mixed types can compare equal (1, 1.0, True), so factorize the text itself
+        return pd.factorize(column.map(str).to_numpy(dtype=object))
+    if pd.api.types.is_string_dtype(column.dtype) and column.dtype != object:
+        labels = np.asarray(uniques, dtype=object)
+    else:
+        labels = np.array([str(value) for value in uniques], dtype=object)
+    missing = codes == -1
+    if missing.any():
+        ## None and NaN are kept apart because they print differently
+        missing_codes, missing_labels = pd.factorize(column[missing].map(str).to_numpy(dtype=object))
+        codes[missing] = len(labels) + missing_codes
+        labels = np.concatenate([labels, missing_labels])
+    label_codes, labels = pd.factorize(labels)
+    return label_codes[codes], labels
+
+# Aggregates file rows to one row per dataset
+## sum_columns are summed; any_columns are True if any file's value contains 'true' (so True, 'True', and 'true' all count)
+## Every other column becomes the sorted, distinct text of its values joined with '; ', matching sorted(set(map(str, values)))
+def aggregate_files_to_datasets(df, group_column='dataset_id', sum_columns=('file_size',), any_columns=()):
+    group_codes, groups = pd.factorize(df[group_column], sort=True)
+    keep = group_codes != -1
+    group_codes = group_codes[keep]
+    df = df[keep]
+    if df.empty:
+        return pd.DataFrame(columns=df.columns)
+    aggregated = {group_column: groups}
+
+    for column in df.columns:
+        if column == group_column:
+            continue
+        if column in sum_columns:
+            aggregated[column] = df[column].groupby(group_codes).sum().reindex(range(len(groups)), fill_value=0).to_numpy()
+            continue
+        codes, labels = text_codes(df[column])
+        if column in any_columns:
+            is_true = np.array(['true' in label.lower() for label in labels], dtype=bool)
+            aggregated[column] = np.bincount(group_codes, weights=is_true[codes], minlength=len(groups)) > 0
+            continue
+        ## One row per (dataset, distinct value), sorted by dataset and then by the value's text
+        sorted_positions = np.argsort(labels)
+        label_order = np.empty(len(labels), dtype=np.int64)
+        label_order[sorted_positions] = np.arange(len(labels))
+        pairs = np.sort(group_codes * len(labels) + label_order[codes])
+        pairs = pairs[np.r_[True, pairs[1:] != pairs[:-1]]]
+        pair_labels = labels[sorted_positions][pairs % len(labels)].tolist()
+        ## Every dataset has at least one file, so the dataset boundaries come straight from the sorted pairs
+        starts = np.searchsorted(pairs // len(labels), np.arange(len(groups) + 1)).tolist()
+        aggregated[column] = np.array(['; '.join(pair_labels[start:end]) for start, end in zip(starts[:-1], starts[1:])], dtype=object)
+
+    return pd.DataFrame(aggregated)
+
 
 
 ## Sensitive data screening
@@ -547,83 +2363,308 @@ def assign_size_bins(df, column='file_size', new_column='file_size_bin'):
 def flag_sensitive_terms(df, terms, columns):
     # Compile regex patterns for each term (case-insensitive, partial match)
     patterns = [re.compile(rf'\b{re.escape(term)}\w*\b', re.IGNORECASE) for term in terms]
-
-    flags_list = []
-    sources_list = []
-
-    for idx, row in df.iterrows():
-        matched_terms = []
-        matched_sources = []
-
-        for col in columns:
-            text = row[col]
-            if pd.isnull(text) or text == '':
-                continue
-            col_matches = []
-            for pattern in patterns:
-                # Find all matches for each pattern
-                matches = pattern.findall(text)
-                if matches:
-                    col_matches.extend(matches)
+    # One alternation of all (case-folded) terms finds the few cells that could contain any term
+    # It's a plain substring test, so it never misses a cell the per-term patterns would match, and
+    # with pandas' pyarrow-backed strings it runs as a single vectorized pass over each column
+    folded_terms = [term.casefold() for term in terms]
+    combined = '|'.join(re.escape(term) for term in folded_terms)
+
+    matched_terms = [[] for _ in range(len(df))]
+    matched_sources = [[] for _ in range(len(df))]
+
+    for col in columns:
+        text = df[col]
+        has_text = text.notna() & (text != '')
+        folded = text.where(has_text, '').astype('string').str.casefold()
+        candidates = (has_text & folded.str.contains(combined, regex=True)).to_numpy(dtype=bool)
+
+        for position, value, folded_value in zip(np.flatnonzero(candidates), text[candidates], folded[candidates]):
+            # Matches are collected term by term, as with a separate search per term
+            col_matches = [match for pattern, term in zip(patterns, folded_terms) if term in folded_value for match in pattern.findall(value)]
             if col_matches:
-                matched_terms.extend(col_matches)
-                matched_sources.append(col)
-
-        # Remove duplicates, but keep all variants found in original order
-        flags = '; '.join(sorted(set(matched_terms), key=matched_terms.index))
-        sources = '; '.join(sorted(set(matched_sources), key=matched_sources.index))
-        flags_list.append(flags)
-        sources_list.append(sources)
+                matched_terms[position].extend(col_matches)
+                matched_sources[position].append(col)
 
-    df['metadata_flags'] = flags_list
-    df['metadata_source'] = sources_list
+    # Remove duplicates, but keep all variants found in original order
+    df['metadata_flags'] = ['; '.join(dict.fromkeys(matches)) for matches in matched_terms]
+    df['metadata_source'] = ['; '.join(dict.fromkeys(sources)) for sources in matched_sources]
     return df
 
-def filter_sensitive_datasets(df):
+# Computes the four sensitive-data criteria once as boolean masks (in the order they're reported in flags_source)
+def sensitive_criteria_masks(df):
     # Criterion 1: flags is not empty
     flagged = df['metadata_flags'].str.strip() != ''
-    
+
     # Criterion 2: Restricted is True or contains 'True' (in a 'True;False' string)
     restricted = (
         (df['restricted'] == True) | 
         (df['restricted'].astype(str).str.contains('True', case=False))
     )
-    
-    # Criterion 3: mimetype contains audio/, video/, or image/
-    mimetype_sensitive = df['original_mime_type'].astype(str).str.contains(r'(audio/|video/)', case=False, regex=True)
-    
+
+    # Criterion 3: mimetype contains audio/ or video/
+    mimetype_sensitive = df['original_mime_type'].astype(str).str.contains(r'(?:audio/|video/)', case=False, regex=True)
+
     # Criterion 4: license != CC0 1.0
     not_cc0 = df['license'] != 'CC0 1.0'
 
-    # If any one of these four occur, return it
-    subset = df[flagged | restricted | mimetype_sensitive | not_cc0]
+    return {
+        'metadata': flagged.to_numpy(dtype=bool),
+        'restricted': restricted.to_numpy(dtype=bool),
+        'file format': mimetype_sensitive.to_numpy(dtype=bool),
+        'license': not_cc0.to_numpy(dtype=bool),
+    }
+
+# Joins the names of the criteria each row meets (e.g., 'restricted; license') without looping over rows
+def criteria_source_labels(masks):
+    labels = np.full(len(next(iter(masks.values()))), '', dtype=object)
+    for name, mask in masks.items():
+        labels = labels + np.where(mask, f'{name}; ', '')
+    return pd.Series(labels, dtype=object).str.removesuffix('; ').to_numpy()
+
+# Single screening pass: returns the rows that meet any criterion, with a flags_source column listing which ones
+def screen_sensitive_datasets(df):
+    masks = sensitive_criteria_masks(df)
+    any_criterion = np.logical_or.reduce(list(masks.values()))
+    subset = df[any_criterion].copy()
+    subset['flags_source'] = criteria_source_labels(masks)[any_criterion]
     return subset
 
+def filter_sensitive_datasets(df):
+    # If any one of these four occur, return it
+    masks = sensitive_criteria_masks(df)
+    return df[np.logical_or.reduce(list(masks.values()))]
+
 def add_final_source_column(df):
-    final_sources = []
-
-    for idx, row in df.iterrows():
-        sources = []
-        # Criterion 1: flagged
-        if row.get('metadata_flags', '').strip() != '':
-            sources.append('metadata')
-        # Criterion 2: restricted
-        restricted_val = row.get('restricted', '')
-        if restricted_val is True or ('True' in str(restricted_val)):
-            sources.append('restricted')
-        # Criterion 3: mimetype
-        mimetype_val = str(row.get('original_mime_type', ''))
-        if any(mt in mimetype_val.lower() for mt in ['audio/', 'video/']):
-            sources.append('file format')
-        # Criterion 4: license
-        license_val = row.get('license', '')
-        if license_val != 'CC0 1.0':
-            sources.append('license')
-        final_sources.append('; '.join(sources))
-
-    df['flags_source'] = final_sources
+    df['flags_source'] = criteria_source_labels(sensitive_criteria_masks(df))
     return df
 
+### Output functions ###
+
+# Declared types for the Parquet copies of the outputs (columns that aren't in a given output are skipped)
+output_schema = {
+    'category': ['institution', 'institution_standardized', 'category_mime_type', 'friendly_format_manual', 'file_size_bin', 'dataset_size_bin'],
+    'datetime': ['createTime', 'publicationDate', 'dataset_created_original', 'created_final', 'file_creation_date', 'file_publication_date', 'creationDate', 'collection_published', 'collection_creation_date'],
+    'list': ['dataset_subjects', 'dataset_keywords', 'dataset_dois', 'collection_contact'],
+}
+
+# Parses dates keeping the wall-clock time each value was written with; UTC offsets are dropped rather than converted
+## so a timestamp written at -05:00 keeps its own time and calendar day
+utc_offset_suffix = re.compile(r'([T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)\s*(?:Z|UTC|[+-]\d{2}(?::?\d{2})?)$')
+def strip_utc_offset(value):
+    if isinstance(value, str):
+        return utc_offset_suffix.sub(r'\1', value.strip())
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    return value
+
+def parse_local_datetimes(values, date_format='mixed'):
+    values = values if isinstance(values, pd.Series) else pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.dt.tz_localize(None) if values.dt.tz is not None else values
+    return pd.to_datetime(values.map(strip_utc_offset), format=date_format, errors='coerce')
+
+# Converts a list-like value (list, array, printed list, or semicolon-delimited string) to a list of strings
+def to_string_list(value):
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [str(item) for item in value]
+    if not isinstance(value, str) or value.strip() == '':
+        return None
+    if value.startswith('['):
+        try:
+            return [str(item) for item in ast.literal_eval(value)]
+        except (ValueError, SyntaxError):
+            pass
+    return value.split('; ')
+
+# Applies output_schema; other columns that mix text with numbers or Booleans are stored as text
+def apply_output_schema(df):
+    df = df.copy()
+    for column in df.columns:
+        if column in output_schema['category']:
+            ## Size bins keep their ordered categories so sorting follows size rather than label
+            df[column] = df[column].astype(size_bin_dtype if column.endswith('_size_bin') else 'category')
+        elif column in output_schema['datetime']:
+            ## Mixed date formats are parsed to time zone-naive values with the same wall-clock time as the CSV
+            df[column] = parse_local_datetimes(df[column])
+        elif column in output_schema['list']:
+            df[column] = df[column].map(to_string_list)
+        elif is_mixed_column(df[column]):
+            df[column] = df[column].where(df[column].isna(), df[column].astype(str))
+    return df
+
+# Checks for a text column that mixes in numbers or Booleans (e.g., file IDs and 'NO FILES'), which Parquet can't store as one type
+def is_mixed_column(series):
+    return series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) in ('mixed', 'mixed-integer')
+
+# Stores mixed columns as text, as they would be after reloading a CSV
+def stringify_mixed_columns(df):
+    df = df.copy()
+    for column in df.columns:
+        if is_mixed_column(df[column]):
+            df[column] = df[column].where(df[column].isna(), df[column].astype(str))
+    return df
+
+# Writes an output CSV and a typed Parquet copy next to it (same name, .parquet extension)
+def write_output(df, path, **kwargs):
+    df.to_csv(path, **kwargs)
+    parquet_path = f'{os.path.splitext(path)[0]}.parquet'
+    try:
+        apply_output_schema(df).to_parquet(parquet_path, index=False)
+    except ImportError:
+        print(f'pyarrow is not installed; only {path} was written.')
+    except Exception as e:
+        print(f'Could not write {parquet_path}: {e}')
+
+# Reads a Parquet output, with list columns as Python lists
+def read_output_parquet(path):
+    df = pd.read_parquet(path)
+    for column in output_schema['list']:
+        if column in df.columns:
+            df[column] = df[column].map(lambda value: list(value) if isinstance(value, np.ndarray) else value)
+    return df
+
+### Report rendering functions ###
+
+# Splits a frame into one frame per value of a column with a single groupby, instead of one boolean mask per value
+## Values with no rows get an empty frame with the same columns
+def partition_frame(df, column, values=()):
+    partitions = {value: group for value, group in df.groupby(column, sort=False, dropna=True)}
+    for value in values:
+        partitions.setdefault(value, df.iloc[0:0])
+    return partitions
+
+# Digest of a figure function's inputs (frames, dicts, lists, and scalars) and of its code
+## A function's code covers its name, bytecode, constants and names, default arguments, nested functions,
+## and the code of the module-level functions it calls (so editing a helper also changes the digest)
+def input_digest(*values):
+    digest = hashlib.sha256()
+    seen_functions = set()
+
+    def update_code(code):
+        digest.update(repr((code.co_qualname, code.co_names, code.co_varnames, code.co_freevars)).encode())
+        digest.update(code.co_code)
+        for constant in code.co_consts:
+            if hasattr(constant, 'co_code'):
+                update_code(constant)
+            else:
+                digest.update(repr(constant).encode())
+
+    def update_function(func):
+        if id(func) in seen_functions:
+            return
+        seen_functions.add(id(func))
+        digest.update(f'{func.__module__}.{func.__qualname__}'.encode())
+        update_code(func.__code__)
+        update(func.__defaults__)
+        update(func.__kwdefaults__)
+        for cell in func.__closure__ or ():
+            try:
+                contents = cell.cell_contents
+            except ValueError:
+                continue
+            if hasattr(contents, '__code__'):
+                update_function(contents)
+        ## Helpers looked up by name in the function's module (e.g. other functions defined in the notebook)
+        for name in func.__code__.co_names:
+            helper = func.__globals__.get(name)
+            if hasattr(helper, '__code__') and getattr(helper, '__module__', None) == func.__module__:
+                update_function(helper)
+
+    def update(value):
+        if isinstance(value, pd.DataFrame):
+            digest.update(repr((list(value.columns), [str(dtype) for dtype in value.dtypes], value.shape)).encode())
+            try:
+                digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+            except TypeError:
+                ## Unhashable cells (like lists) are hashed through their text
+                digest.update(value.to_csv().encode())
+        elif isinstance(value, pd.Series):
+            update(value.to_frame())
+        elif callable(value) and hasattr(value, '__code__'):
+            update_function(value)
+        elif isinstance(value, dict):
+            for key in sorted(value, key=str):
+                update(key)
+                update(value[key])
+        elif isinstance(value, (list, tuple, set)):
+            for item in (sorted(value, key=str) if isinstance(value, set) else value):
+                update(item)
+        else:
+            digest.update(repr(value).encode())
+        digest.update(b'|')
+
+    for value in values:
+        update(value)
+    return digest.hexdigest()
+
+# Rendered PNG that stands in for a matplotlib figure where only savefig is used (like the slide-deck builder)
+## savefig writes the stored PNG; the options the PNG was rendered with are fixed when it's rendered
+class RenderedFigure:
+    def __init__(self, png):
+        self.png = png
+
+    def savefig(self, stream, **kwargs):
+        stream.write(self.png)
+
+pyplot_lock = threading.Lock()
+
+# Renders a figure to PNG, reusing the PNG from an earlier run when the function and its inputs are unchanged
+## Functions that return None (nothing to plot) are cached as such; salt is for settings the function reads outside its arguments
+def render_cached_figure(cache_dir, name, figure_func, *args, salt='', save_options=None):
+    save_options = save_options or {'format': 'png', 'dpi': 100, 'bbox_inches': 'tight'}
+    key = input_digest(name, figure_func, args, save_options, salt)
+    png_path = os.path.join(cache_dir, f'{name}_{key}.png')
+    none_path = os.path.join(cache_dir, f'{name}_{key}.none')
+    if os.path.exists(none_path):
+        return None
+    if os.path.exists(png_path):
+        with open(png_path, 'rb') as f:
+            return RenderedFigure(f.read())
+
+    import matplotlib.pyplot as plt
+    os.makedirs(cache_dir, exist_ok=True)
+    ## pyplot keeps one current figure per process, so threads take turns drawing
+    with pyplot_lock:
+        fig = figure_func(*args)
+        if fig is None:
+            open(none_path, 'w').close()
+            return None
+        buffer = io.BytesIO()
+        fig.savefig(buffer, **save_options)
+        plt.close(fig)
+    ## Written under a temporary name first so a crashed worker never leaves a partial PNG behind
+    temp_path = f'{png_path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(buffer.getvalue())
+    os.replace(temp_path, png_path)
+    return RenderedFigure(buffer.getvalue())
+
+# Switches matplotlib to the non-interactive Agg backend (for spawned worker processes)
+def use_agg_backend():
+    import matplotlib
+    matplotlib.use('Agg', force=True)
+
+# Runs func(*args) for every task in parallel and returns {key: result}; tasks that raise are printed and left out
+## Functions importable from a module run in spawned worker processes using the Agg backend
+## Functions defined in a notebook can't be sent to spawned workers (and forking a multithreaded Jupyter kernel is unsafe), so they run in threads;
+## render_cached_figure draws one figure at a time, and the notebook's plotting backend is left as it is
+def run_in_processes(func, tasks, max_workers=None):
+    importable = getattr(func, '__module__', '__main__') != '__main__' and '<' not in func.__qualname__
+    if importable:
+        executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'), initializer=use_agg_backend)
+    else:
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+    results = {}
+    with executor:
+        futures = {executor.submit(func, *args): key for key, args in tasks.items()}
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                print(f'Error processing {key}: {e}\n')
+    return results
+
 ### Logging functions ###
 # Function to indent text in summary text file
 def single_tab(text, indent="   "):